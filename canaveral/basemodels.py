@@ -2,16 +2,31 @@ from __future__ import annotations
 
 import sys
 import os
+from array import array
+import heapq
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from pathlib import Path
-from fnmatch import fnmatch
 import string
+import threading
+from time import perf_counter, monotonic, time
+from typing import TYPE_CHECKING, Callable, Iterable
 
 import winpath
 from tabulate import tabulate
 import yaml
 from loguru import logger
 
+from canaveral.itemstore import ItemStore, CatalogItem, char_mask, find_positions
+from canaveral.searchkey import search_key
+from canaveral.crawler import (Crawler, CrawlStats, FoundPaths, PatternMatcher, scan_directory,
+                               DEFAULT_MAX_CRAWL_WORKERS, DEFAULT_CRAWL_TIMEOUT, DEFAULT_UNREADABLE_RETRY_INTERVAL)
+from canaveral.throttle import DEFAULT_BACKGROUND_CRAWL_RATE
+from canaveral.snapshot import load_catalog_snapshot, save_catalog_snapshot, SnapshotFormatError
+
+if TYPE_CHECKING:
+    from canaveral.vectorized import VectorizedEngine
+
 if Path(sys.executable).stem != 'pythonw':
     import prettyprinter
     prettyprinter.install_extras(include=('dataclasses',))
@@ -26,6 +41,7 @@ if Path(sys.executable).stem != 'pythonw':
 # - Non-consecutive matching letters in name
 # ? Consecutive matching letters in path
 # - Non-consecutive matching letters in path
+# - Recently modified (from the mtime captured when crawling)
 
 LATEST_MATCH_WEIGHT = 5
 PREVIOUSLY_LAUNCHED_WEIGHT = 4
@@ -33,52 +49,64 @@ CONSEC_NAME_WEIGHT = 2
 INITIAL_LETTERS_NAME_WEIGHT = 1.5
 NONCONSEC_NAME_WEIGHT = 0.5
 NONCONSEC_PATH_WEIGHT = 0.25
+RECENTLY_MODIFIED_WEIGHT = 1
+RECENTLY_MODIFIED_DAYS = 30  # the boost fades from full (modified today) to none over this many days
+SECONDS_PER_DAY = 24 * 60 * 60
 WORD_SEPARATORS = ' \t_-'
+Alignment = tuple[int, float, tuple[int, ...]]  # end position, consecutive + initial letter score, indices
 
 
 #%%
-def deep_glob(path: Path | os.DirEntry, depth: int = 0, patterns: list[str] = ('*',),
+def deep_glob(path: Path | os.DirEntry, depth: int = 0, patterns: list[str] | PatternMatcher = ('*',),
               include_dirs=False, exclude_dotdirs=True, search_dotdirs=False):
     # Negative values for depth will descend into all subdirectories
-    try:
-        for child in os.scandir(path):
-            if child.is_dir():
-                is_not_dotdir = fnmatch(child.name, '[!.]*')
-                if include_dirs and (not exclude_dotdirs or is_not_dotdir):
-                    yield child
-                if depth != 0 and (search_dotdirs or is_not_dotdir):
-                    yield from deep_glob(path=child.path, depth=depth - 1, patterns=patterns,
-                                         include_dirs=include_dirs, exclude_dotdirs=exclude_dotdirs,
-                                         search_dotdirs=search_dotdirs)
-            else:
-                name = child.name
-                for pattern in patterns:
-                    if fnmatch(name, pattern):
-                        yield child
-    except PermissionError:
-        pass
-
-
-def findall(string, char, start=0):
-    return [i+start for i, c in enumerate(string[start:]) if c == char]
-
-
-@dataclass(frozen=True)  # needs to be frozen so we can hash it to create a set of these
-class CatalogItem:
+    if not isinstance(patterns, PatternMatcher):
+        patterns = PatternMatcher(patterns)  # compile once for the whole walk
+    scan = scan_directory(path, descend=depth != 0, patterns=patterns, include_dirs=include_dirs,
+                          exclude_dotdirs=exclude_dotdirs, search_dotdirs=search_dotdirs)
+    if scan.permission_denied:
+        logger.debug(f'Permission denied: {path}')
+    yield from scan.matches
+    for subdir in scan.subdirs:
+        yield from deep_glob(path=subdir.path, depth=depth - 1, patterns=patterns,
+                             include_dirs=include_dirs, exclude_dotdirs=exclude_dotdirs,
+                             search_dotdirs=search_dotdirs)
+
+
+def starts_word(name: str, offsets: array | None, index: int) -> bool:
     """
-    Represents an item in a catalog. Initialized w/ the full path of an item and constructs the name and
-    lower-case name from this.
+    Whether the character at index in an item's search key starts a word of its name (offsets as from
+    ItemStore.key_offsets). Only the first key character of a name character can, e.g. not the second 's' of 'ß'.
     """
-    full_path: Path
-    name: str | None = field(repr=False, default=None)
-    lower_name: str | None = field(repr=False, default=None)
+    if offsets is None:
+        return index == 0 or name[index - 1] in WORD_SEPARATORS
+    name_index = offsets[index]
+    return (index == 0 or offsets[index - 1] != name_index) and \
+        (name_index == 0 or name[name_index - 1] in WORD_SEPARATORS)
 
-    def __repr__(self):
-        return f"CatalogItem(full_path='{self.full_path}')"
 
-    def __post_init__(self):
-        object.__setattr__(self, 'name', self.full_path.name)
-        object.__setattr__(self, 'lower_name', self.full_path.name.lower())
+def extend_alignments(alignments: list[Alignment], positions: Iterable[int], bonus: Callable[[int], float]) \
+        -> list[Alignment]:
+    """
+    The best alignment ending at each of positions (those of the next query character, in order), given the best
+    alignment ending at each position of the previous character. An alignment's score is the consecutive & initial
+    letter part of the Score for its indices; bonus(position) gives the initial letter part for a position.
+    """
+    extended = []
+    previous = 0
+    best_before = None  # the best alignment ending before position - 1
+    for position in positions:
+        while previous < len(alignments) and alignments[previous][0] < position - 1:
+            if best_before is None or alignments[previous][1] > best_before[1]:
+                best_before = alignments[previous]
+            previous += 1
+        best, score = best_before, None if best_before is None else best_before[1]
+        if previous < len(alignments) and alignments[previous][0] == position - 1 and \
+                (score is None or alignments[previous][1] + CONSEC_NAME_WEIGHT > score):
+            best, score = alignments[previous], alignments[previous][1] + CONSEC_NAME_WEIGHT
+        if best is not None:
+            extended.append((position, score + bonus(position), best[2] + (position,)))
+    return extended
 
 
 @dataclass
@@ -92,8 +120,14 @@ class SearchPathEntry:
     exclude_dotdirs: bool = True
     search_dotdirs: bool = False
     search_depth: int = 0
+    exclude: list[str] = field(default_factory=list)  # directory names or root-relative paths to skip, see ExcludeRules
+    use_gitignore: bool = False  # skip anything ignored by .gitignore files at or below the root
+    refresh_interval: float | None = None  # seconds between background refreshes, if not the catalog's default
+    crawl_timeout: float | None = None  # seconds before a crawl of this path is abandoned, if not the catalog's default
+    matcher: PatternMatcher = field(init=False, repr=False, compare=False)  # patterns compiled for the crawler
 
     def __post_init__(self):
+        self.matcher = PatternMatcher(self.patterns)
         match self.path:
             case '$user_docs':
                 self.full_path = Path(winpath.get_my_documents())
@@ -101,6 +135,75 @@ class SearchPathEntry:
                 self.full_path = Path(winpath.get_programs())
             case _:
                 self.full_path = Path(self.path).expanduser()
+        # Normalized, so the same root written two ways (e.g. with a trailing slash or '..') is recognized as such
+        self.full_path = Path(os.path.abspath(self.full_path))
+
+
+DEFAULT_REFRESH_INTERVAL = 5 * 60  # seconds
+DEFAULT_QUERY_CACHE_BYTES = 64 * 1024 * 1024  # for the queries that aren't pinned, see QueryCache
+
+
+@dataclass(frozen=True)
+class CatalogVersion:
+    """
+    An immutable set of catalog items, with one partition per search path. New versions are built from the latest
+    one (on any thread) and then installed by the thread that owns the catalog's queries, so readers never see a
+    half-built catalog. added & removed are the differences from the version this one was built from.
+    Items are held as their ids in the catalog's ItemStore.
+    """
+    generation: int
+    partitions: tuple[frozenset[int], ...]
+    items: array  # of item ids, in the order they were added
+    item_set: frozenset[int]
+    base_generation: int | None = None
+    added: tuple[int, ...] = ()
+    removed: frozenset[int] = frozenset()
+
+    def __repr__(self):
+        return f'CatalogVersion(generation={self.generation}): {len(self.items)} items, ' \
+               f'{len(self.added)} added, {len(self.removed)} removed'
+
+    @classmethod
+    def empty(cls, partition_count: int) -> CatalogVersion:
+        return cls(0, tuple(frozenset() for _ in range(partition_count)), array('I'), frozenset())
+
+    def derive(self, partitions: tuple[frozenset[int], ...], streamed: list[int] = ()) -> CatalogVersion:
+        """
+        A new version with the given partitions, plus streamed items that aren't in any partition yet (the crawl's
+        final results, which will include them, replace the partitions later). Items found by more than one search
+        path stay until they're gone from all of them.
+        """
+        changed = [index for index, (old, new) in enumerate(zip(self.partitions, partitions))
+                   if old is not new and old != new]
+        removed = frozenset(item for index in changed for item in self.partitions[index] - partitions[index]
+                            if not any(item in partition for partition in partitions))
+        added = tuple(item for item in dict.fromkeys(
+            [item for index in changed for item in partitions[index] - self.partitions[index]] + list(streamed))
+                      if item not in self.item_set)
+        if not changed and not added:
+            return self
+
+        items = self.items
+        if removed:
+            items = array('I', (item for item in items if item not in removed))
+        return CatalogVersion(generation=self.generation + 1,
+                              partitions=partitions,
+                              items=items + array('I', added),
+                              item_set=(self.item_set - removed).union(added),
+                              base_generation=self.generation,
+                              added=added,
+                              removed=removed)
+
+
+@dataclass(frozen=True)
+class LetterQueries:
+    """
+    Queries for single letters, built against a catalog version by Catalog.build_letter_queries (on any thread) to be
+    added to the catalog's cache by install_letter_queries
+    """
+    generation: int  # of the version they were built against
+    launch_data_version: int  # of the catalog's launch data they were scored with
+    queries: dict[str, Query]
 
 
 # @dataclass
@@ -108,32 +211,135 @@ class Catalog:
     """
     Stores the file index, along with the queries that have been executed (and their results), the paths
     being searched, the record of what the user has chosen to launch from past queries, the list of
-    recently-launched items in the index, and the location of a file that stores the user's choices
+    recently-launched items in the index, and the location of a file that stores the user's choices.
+
+    If a snapshot file is given and holds a usable snapshot, the catalog is populated from it instead of crawling;
+    the caller is then expected to reconcile it with the filesystem by calling refresh_items_list (or crawl &
+    set_items) later, e.g. from a background thread. Passing refresh=False skips the initial crawl entirely, for
+    callers that populate the catalog themselves (e.g. by streaming a crawl into add_items).
+
+    Background crawls (e.g. periodic refreshes) are limited to background_crawl_rate directories per second (None
+    for no limit) and run with lowered I/O priority; the initial crawl and refresh_items_list run at full speed.
+    A search path whose crawl takes longer than its crawl_timeout (or the catalog's; 0 or less, or None, for no
+    limit) keeps its previous items, and directories that couldn't be read are only retried every
+    unreadable_retry_interval refreshes.
+
+    Queries are cached (see QueryCache), so typing another letter only has to extend the previous query's matches.
+    The cache evicts the least recently used queries once they take more than query_cache_bytes.
+
+    Items are kept in one partition per search path, and each partition can be refreshed on its own schedule (the
+    search path's refresh_interval, or the catalog's) and swapped in without touching the others. items is the
+    union of the partitions.
+
+    The items live in an immutable CatalogVersion. Changes are made by building a new version (build_version,
+    build_changes_version & build_streamed_version are safe to call from any thread) and installing it with
+    install_version on the thread that owns the queries, which bumps the catalog's generation. set_items,
+    apply_changes & add_items do both in one go.
+
+    The items themselves are stored compactly in an ItemStore, and versions & queries refer to them by id. The
+    launch data is also kept as item ids, so scoring never needs an item's Path.
     """
-    items: list[CatalogItem]
-    queries: dict[str, Query]
+    version: CatalogVersion
+    store: ItemStore
+    refresh_times: list[float | None]  # when each search path was last crawled (time.monotonic)
+    refresh_interval: float  # default for search paths without their own, in seconds
+    queries: QueryCache
     search_paths: list[SearchPathEntry]
     launch_choices: dict[str, Path]  # dict where keys are the abbreviations that were typed,
                                      # and the values are the resulting paths that were launched
     recent_launches: list[Path]  # list of all the recent items that were launched, ordered recent to oldest
+    launch_choice_ids: dict[str, int]  # launch_choices & recent_launches as item ids
+    recent_launch_ids: set[int]
+    launch_data_version: int  # bumped whenever the launch data changes
     recent_launch_list_limit: int
     launch_data_file: Path
+    snapshot_file: Path | None
+    snapshot_loaded: bool
+    crawler: Crawler
 
     def __init__(self, search_paths: list[SearchPathEntry], launch_data_file: Path | None = None,
-                 recent_launch_list_limit: int = 50):
-        self.items = []
+                 recent_launch_list_limit: int = 50, max_crawl_workers: int = DEFAULT_MAX_CRAWL_WORKERS,
+                 snapshot_file: Path | None = None, refresh: bool = True, exclude: list[str] = (),
+                 background_crawl_rate: float | None = DEFAULT_BACKGROUND_CRAWL_RATE,
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 crawl_timeout: float | None = DEFAULT_CRAWL_TIMEOUT,
+                 unreadable_retry_interval: int = DEFAULT_UNREADABLE_RETRY_INTERVAL,
+                 query_cache_bytes: int = DEFAULT_QUERY_CACHE_BYTES):
         self.search_paths = search_paths
-        self.queries = {}
+        self.store = ItemStore()
+        self.version = self._latest_version = CatalogVersion.empty(len(search_paths))
+        self._build_lock = threading.Lock()
+        self.refresh_times = [None for _ in search_paths]
+        self.refresh_interval = refresh_interval
+        self.crawler = Crawler(max_workers=max_crawl_workers, exclude=exclude, background_rate=background_crawl_rate,
+                               timeout=crawl_timeout, unreadable_retry_interval=unreadable_retry_interval)
+        self.queries = QueryCache(max_bytes=query_cache_bytes)
+        self._vectorized_engine = None
         self.recent_launch_list_limit = recent_launch_list_limit
         self.recent_launches = []
         self.launch_choices = {}
+        self.launch_data_version = 0
         self.launch_data_file = launch_data_file
+        self.snapshot_file = snapshot_file
         self.load_launch_data_from_file()
-        self.refresh_items_list()
+        self.snapshot_loaded = self.load_snapshot()
+        if refresh and not self.snapshot_loaded:
+            self.refresh_items_list()
 
     def __repr__(self):
-        return f'Catalog: {len(self.items)} items, {len(self.search_paths)} search paths, ' \
-               f'{len(self.queries)} queries'
+        return f'Catalog: {len(self.version.items)} items, {len(self.search_paths)} search paths, ' \
+               f'{self.queries}'
+
+    @property
+    def items(self) -> tuple[CatalogItem, ...]:
+        """Handles for the current items, made on demand (the version only holds their ids)"""
+        return tuple(CatalogItem(self.store, item_id) for item_id in self.version.items)
+
+    @property
+    def vectorized_engine(self) -> VectorizedEngine:
+        """
+        An alternative to query for ranking the whole catalog at once, e.g. vectorized_engine.top_k('abc'), built
+        for the current version when first asked for. Needs NumPy.
+        """
+        version = self.version
+        if self._vectorized_engine is None or self._vectorized_engine.generation != version.generation:
+            from canaveral.vectorized import VectorizedEngine  # NumPy is optional, so only imported when needed
+            self._vectorized_engine = VectorizedEngine(self, version)
+        return self._vectorized_engine
+
+    @property
+    def partitions(self) -> tuple[frozenset[int], ...]:
+        return self.version.partitions
+
+    @property
+    def generation(self) -> int:
+        return self.version.generation
+
+    @property
+    def latest_version(self) -> CatalogVersion:
+        """The version built most recently, which may not have been installed yet"""
+        return self._latest_version
+
+    @property
+    def crawl_stats(self) -> list[CrawlStats | None]:
+        """What the last crawl of each search path did (None for any that haven't been crawled yet)"""
+        return self.crawler.stats_for(self.search_paths)
+
+    def print_crawl_stats(self) -> None:
+        stats = [search_path_stats for search_path_stats in self.crawl_stats if search_path_stats is not None]
+        print(tabulate({
+            'Search Path': [search_path_stats.path for search_path_stats in stats],
+            'Wall Time (s)': [search_path_stats.wall_time for search_path_stats in stats],
+            'Visit Time (s)': [search_path_stats.visit_time for search_path_stats in stats],
+            'Dirs Visited': [search_path_stats.directories_visited for search_path_stats in stats],
+            'Dirs Scanned': [search_path_stats.directories_scanned for search_path_stats in stats],
+            'Entries Examined': [search_path_stats.entries_examined for search_path_stats in stats],
+            'Entries Matched': [search_path_stats.entries_matched for search_path_stats in stats],
+            'Permission Errors': [search_path_stats.permission_errors for search_path_stats in stats],
+            'Unreadable Skipped': [search_path_stats.unreadable_skipped for search_path_stats in stats],
+            'Pruned': [search_path_stats.pruned_subtrees for search_path_stats in stats],
+            'Timed Out': [search_path_stats.timed_out for search_path_stats in stats],
+        }, headers='keys', floatfmt='0.3f'))
 
     def load_launch_data_from_file(self) -> None:
         if self.launch_data_file is not None and self.launch_data_file.exists():
@@ -141,8 +347,17 @@ class Catalog:
                 launch_data = yaml.safe_load(file)
             self.launch_choices = {q: Path(pathstr) for q, pathstr in launch_data['launch choices'].items()}
             self.recent_launches = [Path(pathstr) for pathstr in launch_data['recent launches']]
+        self._update_launch_ids()
+
+    def _update_launch_ids(self) -> None:
+        # Keyed by search key, like the queries, in case the launch data was saved by a version that didn't fold them
+        self.launch_choice_ids = {search_key(q): self.store.add(str(choice))
+                                  for q, choice in self.launch_choices.items()}
+        self.recent_launch_ids = {self.store.add(str(launch_path)) for launch_path in self.recent_launches}
+        self.launch_data_version += 1
 
     def update_launch_data(self, query_string: str, new_launch_choice: Path) -> None:
+        query_string = search_key(query_string)
         old_launch_choice = self.launch_choices.get(query_string, None)
         self.launch_choices[query_string] = new_launch_choice
         try:
@@ -154,6 +369,7 @@ class Catalog:
         self.recent_launches.insert(0, new_launch_choice)
         while len(self.recent_launches) > self.recent_launch_list_limit:
             self.recent_launches.pop()
+        self._update_launch_ids()
 
         data = {
             'launch choices': {q: str(choice) for q, choice in self.launch_choices.items()},
@@ -167,141 +383,560 @@ class Catalog:
         else:
             logger.info(f'Updating scores for new: {new_launch_choice.name}, old: {old_launch_choice.name}')
 
+        old_item_id = None if old_launch_choice is None else self.store.add(str(old_launch_choice))
+        new_item_id = self.store.add(str(new_launch_choice))
         updates = 0
         for query in self.queries.values():
             if old_launch_choice != new_launch_choice:
-                query.update_match_score_if_relevant(old_launch_choice)
+                query.update_match_score_if_relevant(old_item_id)
                 updates += 1
-            query.update_match_score_if_relevant(new_launch_choice)
+            query.update_match_score_if_relevant(new_item_id)
             updates += 1
         logger.info(f'{updates} updates completed')
 
-    def refresh_items_list(self) -> None:
-        logger.debug('Refreshing catalog items list')
-        items = []
-        self.queries = {}
+    def load_snapshot(self) -> bool:
+        """
+        Populates the catalog from the snapshot file, if it holds a usable snapshot. The items are loaded along with
+        their search keys & indexes, so this costs little more than reading the file. No queries are made: the
+        letter queries are built when first asked for (or ahead of time by the caller, e.g. on another thread).
+        """
+        if self.snapshot_file is None or not self.snapshot_file.exists():
+            return False
 
-        for search_path in self.search_paths:
-            expanded_path = search_path.full_path.expanduser()
+        start_time = perf_counter()
+        try:
+            self.crawler.snapshots, items = load_catalog_snapshot(self.snapshot_file)
+        except SnapshotFormatError as e:
+            logger.info(f'Ignoring catalog snapshot, catalog will be rebuilt: {e}')
+            return False
+
+        if items is not None and not self._latest_version.items:
+            # The launch data's ids were handed out by the store being replaced, so they're looked up again
+            self.store = ItemStore.from_columns(items)
+            self._update_launch_ids()
+        self.install_version(self.build_version(self.crawler.crawl(self.search_paths, cached_only=True)))
+        logger.debug(f'Loaded catalog snapshot in {(perf_counter() - start_time)*1000:0.1f} ms')
+        return True
+
+    def save_snapshot(self, found_ids: list[list[int]] = ()) -> None:
+        """Saves the crawler's snapshots along with the catalog's items, and those in found_ids (e.g. from a crawl)"""
+        if self.snapshot_file is not None:
+            item_ids = sorted(self._latest_version.item_set.union(*found_ids))
+            save_catalog_snapshot(self.snapshot_file, self.crawler.snapshots, self.store.columns(item_ids))
+
+    def refresh_items_list(self, incremental: bool = True, indices: list[int] | None = None) -> None:
+        """
+        Re-crawls the search paths (or just those at the given indices). An incremental refresh only rescans
+        directories that changed since the last crawl, and produces the same items as a full rescan.
+        """
+        logger.debug('Refreshing catalog items list')
+        self.install_version(self.crawl_version(incremental=incremental, indices=indices))
+
+    @property
+    def refresh_intervals(self) -> list[float]:
+        return [search_path.refresh_interval or self.refresh_interval for search_path in self.search_paths]
+
+    def due_search_paths(self, timed_out_only: bool = False) -> list[int]:
+        """
+        Indices of the search paths that haven't been crawled within their refresh interval. With timed_out_only=True,
+        only those whose last crawl timed out, e.g. when changes to the rest are already picked up by watching.
+        """
+        now = monotonic()
+        crawl_stats = self.crawl_stats if timed_out_only else None
+        return [index for index, (refresh_time, interval) in enumerate(zip(self.refresh_times, self.refresh_intervals))
+                if (refresh_time is None or now - refresh_time >= interval)
+                and (crawl_stats is None or crawl_stats[index] is not None and crawl_stats[index].timed_out)]
+
+    def crawl(self, incremental: bool = True, on_batch: Callable[[list[str]], None] | None = None,
+              background: bool = False, indices: list[int] | None = None) -> list[FoundPaths | None]:
+        """
+        Crawls the search paths (or just those at the given indices) and saves the catalog snapshot. Only touches
+        the crawler, not the items or queries, so it's safe to call from a background thread and pass the results
+        to set_items on the main thread. Paths are also passed to on_batch as they're found, e.g. for passing on to
+        add_items. Background crawls are throttled. The results for any search path that timed out are None.
+        """
+        start_time = monotonic()
+        crawl_results = self.crawler.crawl(self.search_paths, incremental=incremental, on_batch=on_batch,
+                                           background=background, indices=indices)
+        crawl_stats = self.crawl_stats
+        for index in range(len(self.search_paths)) if indices is None else indices:
+            self.refresh_times[index] = start_time
+            logger.debug(f'Crawl stats: {crawl_stats[index]}')
+        # The items found are added to the store now (building a version from them then only has to look them up),
+        # so that they're saved in the snapshot along with the directories they came from
+        self.save_snapshot([self.store.add_found(found_paths) for found_paths in crawl_results
+                            if found_paths is not None])
+        return crawl_results
+
+    def crawl_version(self, incremental: bool = True, on_batch: Callable[[list[str]], None] | None = None,
+                      background: bool = False, indices: list[int] | None = None) -> CatalogVersion:
+        """
+        Crawls (see crawl) and builds a version from the results, holding the crawler's lock throughout, so that a
+        rescan (see rescan_version) can't slip in between and have its changes undone by the crawl's older results.
+        Safe to call from any thread.
+        """
+        with self.crawler.lock:
+            crawl_results = self.crawl(incremental=incremental, on_batch=on_batch, background=background,
+                                       indices=indices)
+            return self.build_version(crawl_results, indices)
+
+    def rescan_version(self, directories: set[str]) -> CatalogVersion | None:
+        """
+        Rescans directories that are known to have changed (see Crawler.rescan_directories) and builds a version with
+        the changes, or returns None if there weren't any. Holds the crawler's lock throughout, like crawl_version.
+        Safe to call from any thread.
+        """
+        with self.crawler.lock:
+            added, removed = self.crawler.rescan_directories(self.search_paths, directories)
+            if not (any(added) or any(removed)):
+                return None
+            return self.build_changes_version(added, removed)
+
+    def _build(self, make_partitions: Callable[[CatalogVersion], tuple[frozenset[int], ...]],
+               streamed: list[int] = ()) -> CatalogVersion:
+        # Versions are built one at a time, each from the last one built, so each contains every earlier change
+        with self._build_lock:
+            base = self._latest_version
+            self._latest_version = base.derive(make_partitions(base), streamed)
+            return self._latest_version
+
+    def build_version(self, crawl_results: list[list[str] | None],
+                      indices: list[int] | None = None) -> CatalogVersion:
+        """
+        A new version with the partitions for the search paths at the given indices (default all) replaced. Search
+        paths with None for their results (their crawl timed out) keep their partitions, and take in any items streamed
+        from the crawl that aren't in a partition, so that a later crawl can remove them again.
+        """
+        new_partitions = {}
+        timed_out = []
+        for index, found_paths in zip(range(len(self.search_paths)) if indices is None else indices, crawl_results):
+            if found_paths is None:
+                timed_out.append(index)
+                continue
+            search_path = self.search_paths[index]
+            partition = set(self.store.add_found(found_paths))
             if search_path.include_root:
-                items.append(CatalogItem(expanded_path))
-
-            items += [CatalogItem(Path(dir_entry.path))
-                      for dir_entry in deep_glob(expanded_path,
-                                                 depth=search_path.search_depth,
-                                                 patterns=search_path.patterns,
-                                                 include_dirs=search_path.include_dirs,
-                                                 exclude_dotdirs=search_path.exclude_dotdirs,
-                                                 search_dotdirs=search_path.search_dotdirs)]
-
-        self.items = list(set(items))
-        logger.debug(f'Catalog has {len(self.items)} entries')
-
-        # Pre-populate queries for each letter
+                partition.add(self.store.add(str(search_path.full_path)))
+            new_partitions[index] = frozenset(partition)
+
+        def make_partitions(base: CatalogVersion) -> tuple[frozenset[int], ...]:
+            partitions = dict(new_partitions)
+            if timed_out:
+                orphans = base.item_set.difference(*(partitions.get(index, partition)
+                                                     for index, partition in enumerate(base.partitions)))
+                if orphans:
+                    adopted = {index: set(base.partitions[index]) for index in timed_out}
+                    for item_id in orphans:
+                        adopted[self._owning_search_path(item_id, timed_out)].add(item_id)
+                    partitions.update((index, frozenset(partition)) for index, partition in adopted.items())
+            # Unchanged partitions keep the old object, so they're skipped when working out what changed
+            return tuple(base_partition if partitions.get(index, base_partition) == base_partition
+                         else partitions[index]
+                         for index, base_partition in enumerate(base.partitions))
+
+        return self._build(make_partitions)
+
+    def _owning_search_path(self, item_id: int, indices: list[int]) -> int:
+        """The index (out of indices) of the search path item_id's path is under, or the first if it's under none"""
+        path = self.store.path(item_id)
+        for index in indices:
+            root = str(self.search_paths[index].full_path)
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                return index
+        return indices[0]
+
+    def build_changes_version(self, added_paths: list[list[str]], removed_paths: list[list[str]]) -> CatalogVersion:
+        """
+        A new version with individual items added to & removed from each search path's partition, e.g. as reported
+        by Crawler.rescan_directories
+        """
+        # Paths that were never in the store can't be in the catalog, so there's nothing to remove for them
+        changes = [(set(self.store.add_found(added)),
+                    {self.store.lookup(path) for path in removed} - {None})
+                   for added, removed in zip(added_paths, removed_paths)]
+
+        def make_partitions(base: CatalogVersion) -> tuple[frozenset[int], ...]:
+            return tuple(partition if not (added or removed) else (partition - removed) | added
+                         for partition, (added, removed) in zip(base.partitions, changes))
+
+        return self._build(make_partitions)
+
+    def build_streamed_version(self, found_paths: list[str]) -> CatalogVersion:
+        """A new version with items streamed from a crawl that's still running added, pending its final results"""
+        return self._build(lambda base: base.partitions, self.store.add_found(found_paths))
+
+    def install_version(self, version: CatalogVersion) -> bool:
+        """
+        Makes version the current one, applying its changes to the cached queries. Returns False (changing nothing)
+        if a newer version has already been installed, since every version includes the changes of those before it.
+        """
+        current = self.version
+        if version.generation <= current.generation:
+            return False
+
+        if version.base_generation == current.generation:
+            added, removed = version.added, version.removed
+        else:  # some versions in between were skipped
+            removed = current.item_set - version.item_set
+            added = tuple(item for item in version.items if item not in current.item_set)
+
+        self.version = version
+        for query in self.queries.values():
+            query.remove_items(removed)
+        self._add_matches(added)
+        if added or removed:
+            logger.debug(f'Catalog changes: {len(added)} items added, {len(removed)} removed, '
+                         f'{len(version.items)} entries')
+        return True
+
+    def set_items(self, crawl_results: list[list[str] | None], indices: list[int] | None = None) -> None:
+        """
+        Replaces the partitions for the search paths at the given indices (all of them by default). Only the
+        differences are applied to the cached queries, so a refresh that found no changes leaves them untouched.
+        """
+        self.install_version(self.build_version(crawl_results, indices))
+
+    def prepopulate_queries(self) -> None:
+        """
+        Creates the queries for each letter, if they aren't cached already. Otherwise each is made when it's first
+        asked for, which takes a while for a large catalog (see build_letter_queries for making them on another
+        thread).
+        """
         for letter in string.ascii_lowercase:
-            self.query(letter)
-        logger.debug(f'Searches pre-populated')
-
-    def query(self, query_text: str) -> Query:
-        if query_text not in self.queries:
+            self._query(letter)  # leaves the active query (and so what's pinned in the cache) as it is
+
+    def build_letter_queries(self, version: CatalogVersion) -> LetterQueries:
+        """
+        The queries for the letters that aren't cached yet, made against version (which needn't be installed yet).
+        Safe to call from any thread, so that a large catalog's letter queries don't hold up the one that owns the
+        queries; pass the result to install_letter_queries on that thread.
+        """
+        launch_data_version = self.launch_data_version  # as of before they're scored, so any change is noticed
+        return LetterQueries(generation=version.generation,
+                             launch_data_version=launch_data_version,
+                             queries={letter: Query(catalog=self, parent=self, query=letter, version=version)
+                                      for letter in string.ascii_lowercase if letter not in self.queries})
+
+    def install_letter_queries(self, letter_queries: LetterQueries) -> int:
+        """
+        Adds the queries from build_letter_queries that aren't cached by now, returning how many were added. None are
+        if the version they were made against isn't the current one, or the launch data has changed since, as their
+        results would be out of date.
+        """
+        if letter_queries.generation != self.generation or \
+                letter_queries.launch_data_version != self.launch_data_version:
+            return 0
+        added = 0
+        for letter, query in letter_queries.queries.items():
+            if letter not in self.queries:
+                self.queries[letter] = query
+                added += 1
+        return added
+
+    def add_items(self, found_paths: list[str]) -> None:
+        """
+        Adds items that aren't already in the catalog, e.g. batches streamed from a crawl that's still running. New
+        items are run through the cached queries, so their results include them straight away.
+        """
+        self.install_version(self.build_streamed_version(found_paths))
+
+    def apply_changes(self, added_paths: list[list[str]], removed_paths: list[list[str]]) -> None:
+        """
+        Adds & removes individual items, for each search path's partition, e.g. as reported by
+        Crawler.rescan_directories. Applying the same changes twice has no further effect. Cached queries are
+        updated in place.
+        """
+        self.install_version(self.build_changes_version(added_paths, removed_paths))
+
+    def _add_matches(self, new_items: tuple[int, ...]) -> None:
+        # Runs items that are new to the catalog through the cached queries. Parents are shorter than their children,
+        # so each query's parent has been extended by the time it's reached.
+        if not new_items:
+            return
+
+        new_matches = {}
+        for query_text in sorted(self.queries, key=len):
+            query = self.queries[query_text]
             if len(query_text) > 1:
-                self.query(query_text[:-1])
+                new_matches[query_text] = query.extend_matches(self, new_matches[query_text[:-1]], query_text)
+            else:
+                new_matches[query_text] = query.find_matches(self, self.store.with_chars(new_items, query_text),
+                                                             query_text)
+            query.add_matches(new_matches[query_text])
+
+    def candidates(self, query_text: str, version: CatalogVersion | None = None) -> list[int]:
+        """
+        The ids of the items in version (the current one by default) whose search keys contain every character of
+        query_text (a search key), found by starting from the shortest of the characters' posting lists and checking
+        the rest with the items' masks
+        """
+        version = version or self.version
+        if not query_text:
+            return list(version.items)
+        store = self.store
+        shortest = min((store.posting(char) for char in set(query_text)), key=len)
+        item_set = version.item_set
+        return [item_id for item_id in store.with_chars(shortest, query_text) if item_id in item_set]
+
+    def query(self, query_text: str) -> Query | None:
+        """
+        The query for query_text, which is matched by its search key, so e.g. 'Cafe' finds 'café.txt'. None if the key
+        is empty (e.g. query_text is only accents), as there's nothing to match.
+        """
+        query_text = search_key(query_text)
+        if not query_text:
+            return None
+        self.queries.active_text = query_text
+        query = self._query(query_text)
+        self.queries.evict()
+        return query
+
+    def _query(self, query_text: str) -> Query:
+        if query_text in self.queries:
+            self.queries.hits += 1
+        else:
+            self.queries.misses += 1
+            if len(query_text) > 1:
+                self._query(query_text[:-1])
                 self.queries[query_text] = Query(catalog=self, parent=self.queries[query_text[:-1]], query=query_text)
             else:
                 self.queries[query_text] = Query(catalog=self, parent=self, query=query_text)
 
+        self.queries.move_to_end(query_text)
         return self.queries[query_text]
 
 
+class QueryCache(OrderedDict):
+    """
+    The catalog's queries, keyed by query text, from least to most recently used. Once the queries that aren't pinned
+    are estimated to take more than max_bytes, the least recently used ones are evicted. Single letters are pinned,
+    as every query is built by extending one, and so are the prefixes of the active query (the one most recently
+    asked for), so the next letter typed can extend them. A query's extensions are evicted along with it, so the
+    parent of every cached query stays cached, as Catalog._add_matches relies on.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_QUERY_CACHE_BYTES):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.active_text = ''
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return f'{len(self)} queries (~{self.nbytes / 1024**2:0.1f} MB), {self.hits} hits, {self.misses} misses, ' \
+               f'{self.evictions} evicted'
+
+    def is_pinned(self, query_text: str) -> bool:
+        return len(query_text) == 1 or self.active_text.startswith(query_text)
+
+    @property
+    def nbytes(self) -> int:
+        """Estimated memory held by the cached queries, in bytes"""
+        return sum(query.nbytes for query in self.values())
+
+    def evict(self) -> None:
+        """Evicts the least recently used queries that aren't pinned, until the rest fit in max_bytes"""
+        sizes = {query_text: query.nbytes for query_text, query in self.items() if not self.is_pinned(query_text)}
+        unpinned_bytes = sum(sizes.values())
+        if unpinned_bytes <= self.max_bytes:
+            return
+
+        evicted = 0
+        for query_text in list(sizes):  # oldest first
+            if unpinned_bytes <= self.max_bytes:
+                break
+            if query_text not in self:  # already gone with a shorter query
+                continue
+            for extension in [text for text in self if text.startswith(query_text)]:
+                del self[extension]
+                unpinned_bytes -= sizes[extension]
+                evicted += 1
+        self.evictions += evicted
+        logger.debug(f'Query cache: evicted {evicted} queries, {self}')
+
+
 @dataclass
 class Query:
-    """Stores a list of Match objects corresponding to a given query string, along with the match scores"""
+    """
+    Stores a list of Match objects corresponding to a given query string, along with the match scores. The results
+    are only ranked when asked for: top(k) picks out the best k (O(n log k), which is all the launch list needs),
+    and sorted_score_results sorts them all. Both are cached until the scores change.
+    """
     query_text: str
     matches: list[Match] = field(repr=False)
-    score_results: dict[Path: ScoreResult] = field(repr=False)
-    sorted_score_results: tuple[ScoreResult] = field(default=None, repr=False)
+    score_results: dict[int: ScoreResult] = field(repr=False)  # keyed by item id
+    _top_results: tuple[ScoreResult, ...] | None = field(default=None, repr=False)  # the best len(...) results
+    _sorted_score_results: tuple[ScoreResult, ...] | None = field(default=None, repr=False)
 
-    def __init__(self, catalog: Catalog, parent: Catalog | Query, query: str):
+    def __init__(self, catalog: Catalog, parent: Catalog | Query, query: str, version: CatalogVersion | None = None):
+        # version is the catalog version to search, for a query on the catalog (the current one by default)
         if type(parent) is Catalog:
             self.query_text = query[0]
-            self.matches = [Match(catalog_item=item,
-                                  catalog=catalog,
-                                  match_chars=query[0],
-                                  match_indices=[i])
-                            for item in parent.items
-                            for i in findall(item.lower_name, query[0])]
+            self.matches = self.find_matches(catalog, catalog.candidates(self.query_text, version), self.query_text)
 
         elif type(parent) is Query:
             self.query_text = query[:len(parent.query_text) + 1]
-            query_len = len(self.query_text)
-
-            self.matches = [Match(catalog_item=match.catalog_item,
-                                  catalog=catalog,
-                                  match_chars=query[:query_len],
-                                  match_indices=match.match_indices + [i])
-                            for match in parent.matches
-                            for i in findall(match.catalog_item.lower_name,
-                                             query[query_len-1],
-                                             match.match_indices[-1]+1)]
+            self.matches = self.extend_matches(catalog, parent.matches, self.query_text)
 
         else:
             raise TypeError('Query parent must be either a Catalog or another Query object')
 
         self.score_results = {}
-        self.sorted_score_results = tuple()
+        self._top_results = self._sorted_score_results = None
         self.update_query_scores()
 
     def __repr__(self):
         return f"Query(query_text='{self.query_text}') : {len(self.matches)} matches"
 
+    @property
+    def nbytes(self) -> int:
+        """
+        Estimated memory held by the query, in bytes: its containers, plus a Match & Score (with their attribute
+        dicts, indices & alignments) per match and a ScoreResult per item, sized from the first one of each
+        """
+        total = sys.getsizeof(self.matches) + sys.getsizeof(self.score_results) + \
+            sys.getsizeof(self._top_results) + sys.getsizeof(self._sorted_score_results)
+        if self.matches:
+            match = self.matches[0]
+            total += len(self.matches) * (sys.getsizeof(match) + sys.getsizeof(vars(match)) +
+                                          sys.getsizeof(match.score) + sys.getsizeof(vars(match.score)) +
+                                          sys.getsizeof(match.match_indices) + sys.getsizeof(match.alignments) +
+                                          len(match.alignments) * (sys.getsizeof(match.alignments[0]) +
+                                                                   sys.getsizeof(match.alignments[0][2])))
+        if self.score_results:
+            result = next(iter(self.score_results.values()))
+            total += len(self.score_results) * (sys.getsizeof(result) + sys.getsizeof(vars(result)))
+        return total
+
+    def top(self, k: int) -> tuple[ScoreResult, ...]:
+        """The k best results, best first (in the same order as sorted_score_results, ties included)"""
+        if self._sorted_score_results is not None:
+            return self._sorted_score_results[:k]
+        if self._top_results is None or len(self._top_results) < min(k, len(self.score_results)):
+            self._top_results = tuple(heapq.nlargest(k, self.score_results.values(),
+                                                     key=lambda result: result.total_score))
+        return self._top_results[:k]
+
+    @property
+    def sorted_score_results(self) -> tuple[ScoreResult, ...]:
+        """All the results, best first"""
+        if self._sorted_score_results is None:
+            self._sorted_score_results = tuple(sorted(self.score_results.values(),
+                                                      key=lambda result: result.total_score, reverse=True))
+        return self._sorted_score_results
+
+    def _scores_changed(self) -> None:
+        self._top_results = self._sorted_score_results = None
+
+    @staticmethod
+    def find_matches(catalog: Catalog, items: Iterable[int], query_text: str) -> list[Match]:
+        """
+        Matches for a single-character query among the given items (ids in the catalog's store), which are expected
+        to have been narrowed down to those that can match, e.g. by Catalog.candidates
+        """
+        store = catalog.store
+        matches = []
+        for item_id in items:
+            positions = find_positions(store.char_index(item_id), query_text)
+            if positions:
+                name, offsets = store.name(item_id), store.key_offsets(item_id)
+                alignments = [(i, INITIAL_LETTERS_NAME_WEIGHT if starts_word(name, offsets, i) else 0, (i,))
+                              for i in positions]
+                matches.append(Match.best_of(CatalogItem(store, item_id), catalog, query_text, alignments))
+        return matches
+
+    @staticmethod
+    def extend_matches(catalog: Catalog, parent_matches: list[Match], query_text: str) -> list[Match]:
+        """Matches for query_text, found by extending the matches for its parent (query_text minus the last char)"""
+        store = catalog.store
+        mask = char_mask(query_text[-1])
+        matches = []
+        for match in parent_matches:
+            item_id = match.catalog_item.id
+            if not store.char_mask(item_id) & mask:  # can't contain the new character
+                continue
+            positions = find_positions(store.char_index(item_id), query_text[-1], match.alignments[0][0])
+            if positions:
+                name, offsets = store.name(item_id), store.key_offsets(item_id)
+                alignments = extend_alignments(
+                    match.alignments, positions,
+                    lambda i: INITIAL_LETTERS_NAME_WEIGHT if starts_word(name, offsets, i) else 0)
+                if alignments:
+                    matches.append(Match.best_of(match.catalog_item, catalog, query_text, alignments))
+        return matches
+
+    @staticmethod
+    def match_item(catalog: Catalog, item_id: int, query_text: str) -> Match | None:
+        """The Match for one item, or None if it doesn't match query_text (a search key)"""
+        matches = Query.find_matches(catalog, [item_id], query_text[0])
+        for n in range(2, len(query_text) + 1):
+            matches = Query.extend_matches(catalog, matches, query_text[:n])
+        return matches[0] if matches else None
+
+    def remove_items(self, items: frozenset[int]) -> None:
+        """Drops the matches for items (ids) that have left the catalog"""
+        if not items:
+            return
+        matches = [match for match in self.matches if match.catalog_item.id not in items]
+        if len(matches) < len(self.matches):
+            self.matches = matches
+            for item_id in items:
+                self.score_results.pop(item_id, None)
+            self._scores_changed()
+
+    def add_matches(self, matches: list[Match]) -> None:
+        """Adds matches for items that are new to the catalog, updating the scores"""
+        if matches:
+            self.matches += matches
+            self._merge_score_results(matches)
+
     def update_query_scores(self) -> None:
         self.score_results = {}
-        for match in self.matches:
-            if match.catalog_item.full_path not in self.score_results or \
-                    match.score.result > self.score_results[match.catalog_item.full_path].total_score:
-                self.score_results[match.catalog_item.full_path] = ScoreResult(item=match.catalog_item,
-                                                                               match=match,
-                                                                               total_score=match.score.result)
-
-        self.sorted_score_results = tuple(sorted(self.score_results.values(),
-                                                 key=lambda result: result.total_score, reverse=True))
-
-    def update_match_score_if_relevant(self, item_path: Path) -> None:
-        if item_path in self.score_results:
-            del self.score_results[item_path]
+        self._merge_score_results(self.matches)
+
+    def _merge_score_results(self, matches: list[Match]) -> None:
+        for match in matches:
+            if match.catalog_item.id not in self.score_results or \
+                    match.score.result > self.score_results[match.catalog_item.id].total_score:
+                self.score_results[match.catalog_item.id] = ScoreResult(item=match.catalog_item,
+                                                                        match=match,
+                                                                        total_score=match.score.result)
+        self._scores_changed()
+
+    def update_match_score_if_relevant(self, item_id: int | None) -> None:
+        if item_id in self.score_results:
+            del self.score_results[item_id]
             for match in self.matches:
-                if match.catalog_item.full_path == item_path:
-                    if item_path in match.catalog.recent_launches:
+                if match.catalog_item.id == item_id:
+                    if item_id in match.catalog.recent_launch_ids:
                         match.score.previously_launched = True
                     else:
                         match.score.previously_launched = False
-                    if match.catalog.launch_choices.get(self.query_text, None) == item_path:
+                    if match.catalog.launch_choice_ids.get(self.query_text, None) == item_id:
                         match.score.is_latest_match = True
                     else:
                         match.score.is_latest_match = False
 
                     match.score.update_total()
 
-                score_result = self.score_results.get(match.catalog_item.full_path, None)
+                score_result = self.score_results.get(match.catalog_item.id, None)
                 if (score_result is None) or (match.score.result > score_result.total_score):
-                    self.score_results[match.catalog_item.full_path] = ScoreResult(item=match.catalog_item,
-                                                                                   match=match,
-                                                                                   total_score=match.score.result)
-
-            self.sorted_score_results = tuple(sorted(self.score_results.values(),
-                                                     key=lambda result: result.total_score, reverse=True))
+                    self.score_results[match.catalog_item.id] = ScoreResult(item=match.catalog_item,
+                                                                            match=match,
+                                                                            total_score=match.score.result)
+            self._scores_changed()
 
     def print_scores(self, limit: int | None = 10) -> None:
-        if limit is None:
-            limit = len(self.sorted_score_results)
+        results = self.sorted_score_results if limit is None else self.top(limit)
 
-        total_scores = [result.total_score for result in self.sorted_score_results[:limit]]
-        catalog_indices = [result.catalog_index for result in self.sorted_score_results[:limit]]
-        full_paths = [result.item.full_path for result in self.sorted_score_results[:limit]]
-        item_names = [result.item.full_path.name for result in self.sorted_score_results[:limit]]
+        total_scores = [result.total_score for result in results]
+        catalog_indices = [result.catalog_index for result in results]
+        full_paths = [result.item.full_path for result in results]
+        item_names = [result.item.name for result in results]
 
         print(f'\n\nQuery: {self.query_text}')
-        print(f'{len(self.sorted_score_results)} matches\n')
+        print(f'{len(self.score_results)} matches\n')
         print(tabulate({
             'Total Score': total_scores,
             # 'Catalog Index': catalog_indices,
@@ -310,26 +945,27 @@ class Query:
         }, headers='keys'))
 
     def print_detailed_scores(self, limit: int | None = 10):
-        if limit is None:
-            limit = len(self.sorted_score_results)
-
-        total_scores = [result.total_score for result in self.sorted_score_results[:limit]]
-        catalog_indices = [result.catalog_index for result in self.sorted_score_results[:limit]]
-        item_names = [result.item.full_path.name for result in self.sorted_score_results[:limit]]
-        full_paths = [result.item.full_path for result in self.sorted_score_results[:limit]]
-        consec_name_scores = [result.match.score.consecutive_name for result in self.sorted_score_results[:limit]]
-        initial_letter_scores = [result.match.score.initial_letters_name for result in self.sorted_score_results[:limit]]
-        nonconsec_name_scores = [result.match.score.nonconsecutive_name for result in self.sorted_score_results[:limit]]
-        last_choice_scores = [result.match.score.is_latest_match for result in self.sorted_score_results[:limit]]
-        recent_launch_scores = [result.match.score.previously_launched for result in self.sorted_score_results[:limit]]
+        results = self.sorted_score_results if limit is None else self.top(limit)
+
+        total_scores = [result.total_score for result in results]
+        catalog_indices = [result.catalog_index for result in results]
+        item_names = [result.item.name for result in results]
+        full_paths = [result.item.full_path for result in results]
+        consec_name_scores = [result.match.score.consecutive_name for result in results]
+        initial_letter_scores = [result.match.score.initial_letters_name for result in results]
+        nonconsec_name_scores = [result.match.score.nonconsecutive_name for result in results]
+        last_choice_scores = [result.match.score.is_latest_match for result in results]
+        recent_launch_scores = [result.match.score.previously_launched for result in results]
+        recently_modified_scores = [result.match.score.recently_modified for result in results]
 
         print(f'\n\nQuery: {self.query_text}')
-        print(f'{len(self.sorted_score_results)} matches\n')
+        print(f'{len(self.score_results)} matches\n')
         print(tabulate({
             'Total Score': total_scores,
             'Item Name': item_names,
             'Last match': last_choice_scores,
             'Recent': recent_launch_scores,
+            'Modified': recently_modified_scores,
             # 'Catalog Index': catalog_indices,
             'Consecutive Name': consec_name_scores,
             'Initial Letter': initial_letter_scores,
@@ -343,32 +979,58 @@ class Match:
     """
     Details about a CatalogItem that matches a query string, including:
     - the characters that resulted in the match
-    - the indices where those characters were found in the CatalogItem's name
+    - the indices where those characters were found in the CatalogItem's search key (see name_indices for the
+      corresponding positions in its name), for the best-scoring way of placing them
     - the resulting Score object
+
+    There's one Match per item: rather than one for every way the query's characters can be placed in the search key
+    (which grows combinatorially, e.g. 'eee' in 'Excel Reference Sheet'), it keeps the best alignment ending at each
+    position of the last character, and a dynamic program extends those for the next character (see
+    extend_alignments). The cost per item is bounded by the length of its search key.
     """
     catalog_item: CatalogItem
     catalog: Catalog = field(repr=False)
     match_chars: str = field(default_factory=str)
     match_indices: list[int] = field(default_factory=list)
     score: Score | None = None
+    alignments: list[Alignment] = field(default_factory=list, repr=False)  # ordered by end position
+
+    @classmethod
+    def best_of(cls, catalog_item: CatalogItem, catalog: Catalog, match_chars: str,
+                alignments: list[Alignment]) -> Match:
+        best = max(alignments, key=lambda alignment: alignment[1])
+        return cls(catalog_item=catalog_item, catalog=catalog, match_chars=match_chars,
+                   match_indices=list(best[2]), alignments=alignments)
 
     def __repr__(self):
         return f"Match: match_chars='{self.match_chars}',match_indices={self.match_indices}, score={self.score}"
 
     def __post_init__(self):
-        new_word_score = 0
-        for char_index in self.match_indices:
-            if (char_index == 0) or (self.catalog_item.name[char_index - 1] in WORD_SEPARATORS):
-                new_word_score += 1
-
+        item_id = self.catalog_item.id
+        name = self.catalog_item.name
+        offsets = self.catalog.store.key_offsets(item_id)
+        new_word_score = sum(1 for char_index in self.match_indices if starts_word(name, offsets, char_index))
+
+        mtime = self.catalog.store.mtime(item_id)
+        # In whole days, so scores don't depend on exactly when each match was made
+        age = (time() - mtime) // SECONDS_PER_DAY
         self.score = Score(catalog_item=self.catalog_item,
-                           is_latest_match=self.catalog.launch_choices.get(self.match_chars, None) == self.catalog_item.full_path,
-                           previously_launched=self.catalog_item.full_path in self.catalog.recent_launches,
+                           is_latest_match=self.catalog.launch_choice_ids.get(self.match_chars, None) == item_id,
+                           previously_launched=item_id in self.catalog.recent_launch_ids,
+                           recently_modified=max(0.0, 1 - age / RECENTLY_MODIFIED_DAYS) if mtime else 0,
                            nonconsecutive_name=len(self.match_indices),
                            consecutive_name=sum([1 if y-x == 1 else 0 for x, y in
                                                  zip(self.match_indices[:-1], self.match_indices[1:])]),
                            initial_letters_name=new_word_score)
 
+    @property
+    def name_indices(self) -> list[int]:
+        """The positions in the item's (displayed) name of the matched characters, e.g. for highlighting them"""
+        offsets = self.catalog.store.key_offsets(self.catalog_item.id)
+        if offsets is None:
+            return self.match_indices
+        return sorted({offsets[i] for i in self.match_indices})
+
 
 #%%
 @dataclass
@@ -377,6 +1039,7 @@ class Score:
     catalog_item: CatalogItem
     is_latest_match: bool = False
     previously_launched: bool = False
+    recently_modified: float = 0  # 1 if modified today, fading to 0 over RECENTLY_MODIFIED_DAYS
     consecutive_name: float = 0
     nonconsecutive_name: float = 0
     initial_letters_name: float = 0
@@ -390,7 +1053,8 @@ class Score:
                       self.nonconsecutive_name * NONCONSEC_NAME_WEIGHT + \
                       self.initial_letters_name * INITIAL_LETTERS_NAME_WEIGHT + \
                       self.is_latest_match * LATEST_MATCH_WEIGHT + \
-                      self.previously_launched * PREVIOUSLY_LAUNCHED_WEIGHT
+                      self.previously_launched * PREVIOUSLY_LAUNCHED_WEIGHT + \
+                      self.recently_modified * RECENTLY_MODIFIED_WEIGHT
 
 
 @dataclass
@@ -0,0 +1,866 @@
+"""
+Filesystem crawling used to build the catalog. Each search path root, and each subdirectory found beneath it, is
+scanned as an independent task, so a slow root (e.g. a network-backed Documents folder) doesn't hold up the others.
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field, replace
+from fnmatch import translate
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, NamedTuple
+
+from loguru import logger
+
+from canaveral.gitignore import GitignoreRules, is_ignored, translate as gitignore_translate
+from canaveral.throttle import Throttle, set_background_io_priority, DEFAULT_BACKGROUND_CRAWL_RATE
+
+if TYPE_CHECKING:
+    from canaveral.basemodels import SearchPathEntry
+
+DEFAULT_MAX_CRAWL_WORKERS = 4
+# A search path whose crawl takes longer than this (e.g. a hung network mount) is abandoned, keeping its previous
+# results
+DEFAULT_CRAWL_TIMEOUT = 60  # seconds
+# A directory that couldn't be read isn't tried again for this many refreshes of its search path
+DEFAULT_UNREADABLE_RETRY_INTERVAL = 12
+# A directory modified this recently may change again within the same mtime tick (2 s on FAT), so its snapshot
+# isn't trusted on the next refresh
+RACY_MTIME_WINDOW_NS = 2_000_000_000
+# When streaming, found paths are handed over once a batch is this big or this old (the first batch goes right away)
+STREAM_BATCH_SIZE = 5000
+STREAM_BATCH_INTERVAL = 0.05
+DIRECTORY_SIZE = -1  # size recorded for matches that are directories
+
+
+class PatternMatcher:
+    """
+    A list of fnmatch-style patterns compiled into a single matcher, giving the same results as
+    any(fnmatch(name, pattern) for pattern in patterns). Pure-extension patterns like '*.pdf' are answered with a
+    set lookup on the name's suffix, literal names with a set lookup on the name, and anything else with one
+    combined regex.
+    """
+    patterns: tuple[str]
+    match_all: bool
+    suffixes: frozenset[str]  # single extensions, e.g. '.pdf'
+    long_suffixes: tuple[str]  # extensions containing a dot, e.g. '.tar.gz'
+    literals: frozenset[str]
+    regex: re.Pattern | None
+
+    def __init__(self, patterns: list[str]):
+        self.patterns = tuple(patterns)
+        # fnmatch normalizes case (case-insensitive matching on Windows), so do the same
+        normalized = [os.path.normcase(pattern) for pattern in patterns]
+
+        self.match_all = '*' in normalized
+        suffix_patterns = {pattern for pattern in normalized
+                           if pattern.startswith('*.') and not any(c in pattern[1:] for c in '*?[')}
+        self.suffixes = frozenset(pattern[1:] for pattern in suffix_patterns if '.' not in pattern[2:])
+        self.long_suffixes = tuple(pattern[1:] for pattern in suffix_patterns if '.' in pattern[2:])
+        self.literals = frozenset(pattern for pattern in normalized if not any(c in pattern for c in '*?['))
+        others = [pattern for pattern in normalized
+                  if pattern != '*' and pattern not in self.literals and pattern not in suffix_patterns]
+        self.regex = re.compile('|'.join(translate(pattern) for pattern in others)) if others else None
+
+    def __repr__(self):
+        return f'PatternMatcher({list(self.patterns)})'
+
+    def __call__(self, name: str) -> bool:
+        if self.match_all:
+            return True
+        name = os.path.normcase(name)
+        if name in self.literals:
+            return True
+        dot_index = name.rfind('.')
+        if dot_index >= 0 and name[dot_index:] in self.suffixes:
+            return True
+        if self.long_suffixes and name.endswith(self.long_suffixes):
+            return True
+        return self.regex is not None and self.regex.match(name) is not None
+
+
+class ExcludeRules:
+    """
+    Directories that shouldn't be cataloged or descended into, given as fnmatch-style patterns. A pattern without a
+    '/' is matched against directory names (e.g. 'node_modules'), while one with a '/' is matched against the path
+    relative to the search path root (e.g. 'build/output' or 'projects/*/dist'). In those, as in .gitignore files,
+    '*' doesn't match across a '/', and '**' does: 'projects/*/dist' excludes projects/a/dist but not
+    projects/a/b/dist, which 'projects/**/dist' also excludes.
+    """
+    patterns: tuple[str]
+    names: PatternMatcher | None
+    relative_paths: re.Pattern | None
+
+    def __init__(self, patterns: list[str]):
+        self.patterns = tuple(patterns)
+        patterns = [pattern.replace('\\', '/').strip('/') for pattern in patterns]
+        name_patterns = [pattern for pattern in patterns if '/' not in pattern]
+        # Matched like fnmatch, with case normalized (so case-insensitively on Windows)
+        path_patterns = [gitignore_translate(os.path.normcase(pattern).replace('\\', '/'))
+                         for pattern in patterns if '/' in pattern]
+        self.names = PatternMatcher(name_patterns) if name_patterns else None
+        self.relative_paths = re.compile('|'.join(f'(?:{pattern})' for pattern in path_patterns)) \
+            if path_patterns else None
+
+    def __repr__(self):
+        return f'ExcludeRules({list(self.patterns)})'
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def __call__(self, name: str, relative_path: str) -> bool:
+        return (self.names is not None and self.names(name)) or \
+            (self.relative_paths is not None and
+             self.relative_paths.fullmatch(os.path.normcase(relative_path).replace(os.sep, '/')) is not None)
+
+
+def list_directory(path: str) -> list[os.DirEntry]:
+    with os.scandir(path) as children:
+        return list(children)
+
+
+class ScanResult(NamedTuple):
+    """What scan_directory found in a single directory"""
+    matches: list[os.DirEntry]  # entries that should be cataloged
+    subdirs: list[os.DirEntry]  # subdirectories that should be descended into
+    pruned: int  # subdirectories skipped because of the exclude rules or .gitignore files
+    examined: int  # entries read from the directory
+    permission_denied: bool = False
+
+
+def scan_directory(path: Path | str, descend: bool = False, patterns: list[str] | PatternMatcher = ('*',),
+                   include_dirs=False, exclude_dotdirs=True, search_dotdirs=False,
+                   exclude: ExcludeRules | None = None, root: Path | str | None = None,
+                   gitignore: tuple[GitignoreRules, ...] | None = None,
+                   listing: Callable[[str], list[os.DirEntry]] | None = None) -> ScanResult:
+    """
+    Scans a single directory (non-recursively). Subdirectories are only returned for descending into if descend is
+    True. Relative paths for the exclude rules are taken from root (defaulting to path). An unreadable directory
+    gives an empty result with permission_denied set.
+
+    If gitignore is given (even if empty), entries ignored by that chain of .gitignore rules (which should include
+    the directory's own .gitignore) are skipped, as are .git directories.
+
+    The directory is read with listing (e.g. SharedListings.scandir) if given, otherwise os.scandir.
+    """
+    matcher = patterns if isinstance(patterns, PatternMatcher) else PatternMatcher(patterns)
+    relative_start = len(os.path.join(root if root is not None else path, ''))
+    matches = []
+    subdirs = []
+    pruned = 0
+    examined = 0
+    try:
+        children = (listing or list_directory)(path)
+        examined = len(children)
+        for child in children:
+            if child.is_dir():
+                if (exclude and exclude(child.name, child.path[relative_start:])) or \
+                        (gitignore is not None and (child.name == '.git' or
+                                                    is_ignored(gitignore, child.path, is_dir=True))):
+                    pruned += 1
+                    continue
+                is_not_dotdir = not child.name.startswith('.')
+                if include_dirs and (not exclude_dotdirs or is_not_dotdir):
+                    matches.append(child)
+                if descend and (search_dotdirs or is_not_dotdir):
+                    subdirs.append(child)
+            elif matcher(child.name) and not (gitignore and is_ignored(gitignore, child.path, is_dir=False)):
+                matches.append(child)
+    except PermissionError:
+        return ScanResult(matches, subdirs, pruned, examined, permission_denied=True)
+    except FileNotFoundError:  # removed since its parent was scanned
+        pass
+
+    return ScanResult(matches, subdirs, pruned, examined)
+
+
+def entry_stats(entries: list[os.DirEntry]) -> array:
+    """
+    (mtime in seconds, size) pairs for entries, with DIRECTORY_SIZE as the size of directories, and zeros for any
+    that can't be stat'ed. On Windows the stat comes with the directory listing; elsewhere it costs a call per entry.
+    """
+    stats = array('q')
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except OSError:
+            stats.extend((0, 0))
+            continue
+        stats.extend((int(stat.st_mtime), DIRECTORY_SIZE if entry.is_dir() else stat.st_size))
+    return stats
+
+
+@dataclass
+class DirSnapshot:
+    """
+    What a directory contributed to the catalog the last time it was scanned. A directory's mtime changes whenever
+    an entry is added to, removed from or renamed within it, so an unchanged mtime means the snapshot can be reused
+    without calling os.scandir. mtime_ns is None when the snapshot shouldn't be trusted.
+
+    match_stats holds an (mtime, size) pair per match, as returned by entry_stats. Modifying a file doesn't change
+    its directory's mtime, so these are as of when the directory was last scanned.
+    """
+    mtime_ns: int | None
+    descended: bool
+    match_names: list[str]
+    subdir_names: list[str]
+    gitignore_mtime_ns: int | None = None  # of the directory's own .gitignore, if it has one & it's being used
+    link_names: list[str] = field(default_factory=list)  # the subdirectories that are symlinks
+    match_stats: array = field(default_factory=lambda: array('q'))
+    unreadable_skips: int = 0  # refreshes left before retrying a directory that couldn't be read
+
+
+class FoundPaths(list):
+    """
+    Paths found by a crawl, with their (mtime, size) pairs from the directory snapshots alongside in stats. It's a
+    list of the paths, so it can be used anywhere one is expected.
+    """
+    stats: array
+
+    def __init__(self, paths: list[str] = (), stats: array | None = None):
+        super().__init__(paths)
+        self.stats = array('q', [0, 0]) * len(self) if stats is None else stats
+
+    @classmethod
+    def from_snapshot(cls, path: str, snapshot: DirSnapshot) -> FoundPaths:
+        return cls([os.path.join(path, name) for name in snapshot.match_names], array('q', snapshot.match_stats))
+
+    def extend_found(self, found: FoundPaths) -> None:
+        self.extend(found)
+        self.stats.extend(found.stats)
+
+    def stat(self, index: int) -> tuple[int, int]:
+        return self.stats[2 * index], self.stats[2 * index + 1]
+
+
+class CrawlTask(NamedTuple):
+    """A directory waiting to be visited during a crawl"""
+    index: int  # of the search path it belongs to
+    path: str
+    depth: int  # remaining depth; negative values descend into all subdirectories
+    gitignore: tuple[GitignoreRules, ...] = ()  # .gitignore files that apply in the directory's parent
+    reuse: bool = True  # False if the directory's snapshot is stale even if its mtime is unchanged
+    via_link: bool = False  # reached through a symlink, so it's visited after directories reached directly
+
+
+class Visit(NamedTuple):
+    """The outcome of visiting a directory during a crawl"""
+    snapshot: DirSnapshot | None  # None if the directory had already been visited by another path
+    reused: bool = False  # the previous snapshot was still valid, so the directory wasn't read
+    scan: ScanResult | None = None  # if it was read
+    elapsed: float = 0.0  # seconds, not counting any throttling
+    child_gitignore: tuple[GitignoreRules, ...] = ()  # .gitignore files that apply in its subdirectories
+    children_reusable: bool = True  # whether its subdirectories' previous snapshots may be reused
+    skipped_unreadable: bool = False  # not retried, as it couldn't be read recently
+
+
+@dataclass
+class CrawlStats:
+    """What the last crawl of a single search path did, to help find the roots that make refreshes slow"""
+    path: str
+    wall_time: float = 0.0  # seconds from the start of the crawl until the search path's last directory was done
+    visit_time: float = 0.0  # seconds spent visiting its directories, summed over all worker threads
+    directories_visited: int = 0
+    directories_scanned: int = 0  # the rest were unchanged since the last crawl, so only needed a stat
+    directories_skipped: int = 0  # already visited by another path (symlinks)
+    entries_examined: int = 0
+    entries_matched: int = 0
+    permission_errors: int = 0
+    unreadable_skipped: int = 0  # directories not retried since they couldn't be read on a recent crawl
+    pruned_subtrees: int = 0  # by the exclude rules or .gitignore files
+    timed_out: bool = False  # abandoned at its deadline, so its previous results were kept
+
+    def __str__(self):
+        return f'{self.path}: {self.wall_time:0.3f} s ({self.visit_time:0.3f} s visiting)' \
+               f'{", timed out" if self.timed_out else ""}, ' \
+               f'{self.directories_visited} directories visited ({self.directories_scanned} scanned), ' \
+               f'{self.entries_examined} entries examined, {self.entries_matched} matched, ' \
+               f'{self.permission_errors} permission errors ({self.unreadable_skipped} unreadable directories ' \
+               f'skipped), {self.pruned_subtrees} subtrees pruned, ' \
+               f'{self.directories_skipped} directories skipped as already visited'
+
+
+class SharedListings:
+    """
+    Directory stats & listings for the parts of the filesystem that more than one search path covers (nested roots,
+    or the same root with different settings), kept for the length of a crawl so that each of those directories is
+    only read from disk once. Errors are remembered & re-raised too.
+    """
+    roots: tuple[str, ...]  # normcased
+    hits: int  # stats & listings served from memory
+
+    def __init__(self, roots: list[str]):
+        self.roots = tuple(os.path.normcase(root) for root in roots)
+        self._prefixes = tuple(os.path.join(root, '') for root in self.roots)
+        self._stats = {}
+        self._listings = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def __repr__(self):
+        return f'SharedListings: {len(self.roots)} roots, {len(self._listings)} directories read, {self.hits} hits'
+
+    def covers(self, path: str) -> bool:
+        path = os.path.normcase(path)
+        return path in self.roots or path.startswith(self._prefixes)
+
+    def stat(self, path: str) -> os.stat_result:
+        return self._get(self._stats, path, os.stat)
+
+    def scandir(self, path: str) -> list[os.DirEntry]:
+        return self._get(self._listings, path, list_directory)
+
+    def _get(self, cache: dict, path: str, function: Callable):
+        # Two threads may occasionally read the same directory at once; the first result to arrive is kept
+        with self._lock:
+            result = cache.get(path)
+            if result is not None:
+                self.hits += 1
+        if result is None:
+            try:
+                result = (function(path), None)
+            except OSError as e:
+                result = (None, e)
+            with self._lock:
+                result = cache.setdefault(path, result)
+        value, error = result
+        if error is not None:
+            raise error
+        return value
+
+
+class CrawlContext:
+    """State shared between the threads of a single crawl"""
+    throttle: Throttle | None
+    shared: SharedListings | None
+    deadlines: list[float | None] | None  # time.perf_counter() by which each search path must be done, see deadline
+
+    def __init__(self, search_path_count: int, throttle: Throttle | None = None, shared: SharedListings | None = None,
+                 deadlines: list[float | None] | None = None):
+        self.throttle = throttle
+        self.shared = shared
+        self.deadlines = deadlines
+        self._visited = [set() for _ in range(search_path_count)]  # (st_dev, st_ino) for each search path
+        self._lock = threading.Lock()
+
+    def deadline(self, index: int) -> float | None:
+        """
+        The time (perf_counter) by which the search path must be done, pushed back by however long the throttle has
+        held the crawl up, so a throttled crawl isn't abandoned for going only as fast as it's allowed to
+        """
+        deadline = self.deadlines[index] if self.deadlines is not None else None
+        if deadline is None or self.throttle is None:
+            return deadline
+        return deadline + self.throttle.held_time
+
+    def first_visit(self, index: int, stat: os.stat_result) -> bool:
+        """Whether this is the first time the search path has reached the directory, by whatever path"""
+        if not stat.st_ino:  # not every filesystem provides inode numbers
+            return True
+        identity = (stat.st_dev, stat.st_ino)
+        with self._lock:
+            if identity in self._visited[index]:
+                return False
+            self._visited[index].add(identity)
+            return True
+
+
+def overlapping_roots(search_paths: list[SearchPathEntry]) -> list[tuple[str, str]]:
+    """
+    Finds the search paths whose roots are also reached by another search path's walk, returning (inner root, outer
+    root) pairs. Identical roots are paired with each other.
+    """
+    roots = [(str(search_path.full_path), search_path.search_depth) for search_path in search_paths]
+    overlaps = []
+    for index, (root, _) in enumerate(roots):
+        for other_index, (outer, depth) in enumerate(roots):
+            if other_index == index:
+                continue
+            normalized_root, normalized_outer = os.path.normcase(root), os.path.normcase(outer)
+            if normalized_root == normalized_outer:
+                overlaps.append((root, outer))
+                break
+            if normalized_root.startswith(os.path.join(normalized_outer, '')):
+                relative_depth = len(Path(normalized_root).relative_to(normalized_outer).parts)
+                if depth < 0 or relative_depth <= depth:
+                    overlaps.append((root, outer))
+                    break
+    return overlaps
+
+
+class Crawler:
+    """
+    Walks the directory trees described by a list of SearchPathEntry objects. Directories are scanned by a bounded
+    pool of worker threads; results are merged back on the calling thread, so no locking is needed. With
+    max_workers=1 the same walk runs serially on the calling thread.
+
+    A DirSnapshot is kept for every directory visited, so later incremental crawls only rescan the directories
+    whose mtime has changed (each unchanged directory costs a single stat, plus one for its .gitignore if it has
+    one and the search path uses them).
+
+    Background crawls are limited to background_rate directories per second (None for no limit) and run with
+    lowered I/O priority where the platform supports it.
+
+    Each physical directory is visited at most once per search path, so symlinks that loop back (or alias another
+    part of the tree) don't get walked again. Symlinked directories are only visited once everything reachable
+    without them has been, so directories are cataloged under their real paths where possible. Search paths with
+    identical settings are crawled once, and directories covered by several search paths (e.g. ~ and ~/Documents)
+    are only read from disk once per crawl.
+
+    A search path that isn't done within its crawl_timeout (or the crawler's timeout) is abandoned, and its results
+    from before are kept; the directories it did get through are remembered, so the next crawl only has to stat them.
+    Time spent held back by the background throttle doesn't count towards the timeout. With max_workers=1 the
+    deadline is only checked between directories, so it can't rescue a crawl from a hung one.
+    Directories that can't be read are skipped for the next unreadable_retry_interval crawls of their search path.
+    """
+    max_workers: int
+    exclude: list[str]  # exclude rules applied to every search path, on top of their own
+    background_rate: float | None
+    timeout: float | None  # seconds, for search paths without their own crawl_timeout (None or <= 0 for no limit)
+    unreadable_retry_interval: int  # in crawls
+    snapshots: dict[tuple, dict[str, DirSnapshot]]  # per search path settings, then per directory path
+    stats: dict[tuple, CrawlStats]  # from the last crawl of each search path (by settings, like snapshots)
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_CRAWL_WORKERS, exclude: list[str] = (),
+                 background_rate: float | None = DEFAULT_BACKGROUND_CRAWL_RATE,
+                 timeout: float | None = DEFAULT_CRAWL_TIMEOUT,
+                 unreadable_retry_interval: int = DEFAULT_UNREADABLE_RETRY_INTERVAL):
+        self.max_workers = max(1, max_workers)
+        self.exclude = list(exclude)
+        self.background_rate = background_rate
+        self.timeout = timeout
+        self.unreadable_retry_interval = unreadable_retry_interval
+        self.snapshots = {}
+        self.stats = {}
+        self._exclude_rules = {}
+        self._gitignore_cache = {}
+        # Crawls & rescans may be started from more than one thread. Callers can hold it too, so that what they do
+        # with the results happens in the same order as the changes to the snapshots.
+        self.lock = threading.RLock()
+
+    def __repr__(self):
+        return f'Crawler(max_workers={self.max_workers})'
+
+    def crawl(self, search_paths: list[SearchPathEntry], incremental: bool = True, cached_only: bool = False,
+              on_batch: Callable[[list[str]], None] | None = None, background: bool = False,
+              indices: list[int] | None = None) -> list[FoundPaths | None]:
+        """
+        Returns, for each search path, the paths of the matching entries found beneath it (in no set order), with
+        their stats, or None if its crawl timed out. With cached_only=True the results are rebuilt from the existing
+        snapshots without touching the filesystem.
+
+        If indices is given, only those search paths are crawled and results are returned for them alone (in the
+        same order); the snapshots for the others are kept as they are. Snapshots for anything not in search_paths
+        are discarded either way.
+
+        If on_batch is given, it is also called (on the calling thread) with batches of found paths while the crawl
+        is still running, so they can be used before the whole crawl finishes.
+
+        With background=True the crawl is throttled, for refreshes nobody is waiting on.
+        """
+        with self.lock:
+            return self._crawl(search_paths, incremental, cached_only, on_batch, background, indices)
+
+    def _crawl(self, search_paths: list[SearchPathEntry], incremental: bool, cached_only: bool,
+               on_batch: Callable[[list[str]], None] | None = None, background: bool = False,
+               indices: list[int] | None = None) -> list[FoundPaths | None]:
+        all_keys = [self._snapshot_key(search_path) for search_path in search_paths]
+        if indices is not None:
+            search_paths = [search_paths[index] for index in indices]
+
+        # Search paths with identical settings would produce identical results, so each is only crawled once
+        keys = [self._snapshot_key(search_path) for search_path in search_paths]
+        unique_keys = list(dict.fromkeys(keys))
+        if len(unique_keys) < len(keys) and not cached_only:
+            logger.debug(f'Crawl: {len(keys) - len(unique_keys)} duplicate search paths skipped')
+        unique_paths = [search_paths[keys.index(key)] for key in unique_keys]
+
+        context = CrawlContext(len(unique_paths))
+        if not cached_only:
+            if background and self.background_rate:
+                context.throttle = Throttle(self.background_rate)
+                logger.debug(f'Background crawl, limited to {self.background_rate} directories/s')
+            start_time = time.perf_counter()
+            context.deadlines = [None if timeout is None else start_time + timeout
+                                 for timeout in (self.crawl_timeout(search_path) for search_path in unique_paths)]
+            overlaps = list(dict.fromkeys(overlapping_roots(unique_paths)))
+            if overlaps:
+                for inner, outer in overlaps:
+                    logger.debug(f'Crawl: {inner} is also covered by {outer}, directories they share are read once')
+                context.shared = SharedListings([inner for inner, _ in overlaps])
+
+        previous = [self.snapshots.get(key, {}) if incremental else {} for key in unique_keys]
+        tasks = [CrawlTask(index, str(search_path.full_path), search_path.search_depth)
+                 for index, search_path in enumerate(unique_paths)]
+
+        current, results, stats = self._walk(unique_paths, previous, tasks, cached_only, on_batch, background,
+                                             context)
+        snapshots = {key: self.snapshots[key] for key in all_keys if key in self.snapshots}
+        for key, key_snapshots, key_stats in zip(unique_keys, current, stats):
+            if key_stats.timed_out:
+                # The directories it got through before the deadline are kept, so the next crawl can reuse them
+                logger.info(f'Crawl of {key_stats.path} timed out after {key_stats.wall_time:0.1f} s, keeping its '
+                            f'previous results')
+                snapshots[key] = {**snapshots.get(key, {}), **key_snapshots}
+                results[unique_keys.index(key)] = None
+            else:
+                snapshots[key] = key_snapshots
+        self.snapshots = snapshots
+        if not cached_only:
+            self.stats = {key: self.stats[key] for key in all_keys if key in self.stats}
+            self.stats.update(zip(unique_keys, stats))
+        return [results[unique_keys.index(key)] for key in keys]
+
+    def rescan_directories(self, search_paths: list[SearchPathEntry],
+                           directories: set[str]) -> tuple[list[FoundPaths], list[list[str]]]:
+        """
+        Rescans directories that are known to have changed (e.g. reported by a filesystem watcher), walks any
+        subdirectories that appeared in them and forgets any that disappeared. Directories that weren't part of the
+        last crawl are ignored. Returns, for each search path, the paths (with their stats) that were added to, and
+        the paths that were removed from, its crawl results.
+        """
+        added = [[] for _ in search_paths]
+        removed = [[] for _ in search_paths]
+        with self.lock:
+            snapshots = dict(self.snapshots)
+            rescanned_keys = {}
+            for index, search_path in enumerate(search_paths):
+                key = self._snapshot_key(search_path)
+                if key in rescanned_keys:
+                    added[index], removed[index] = added[rescanned_keys[key]], removed[rescanned_keys[key]]
+                    continue
+                if not directories.intersection(snapshots.get(key, ())):
+                    continue
+                rescanned_keys[key] = index
+
+                current = snapshots[key] = dict(snapshots[key])
+                root = str(search_path.full_path)
+                added_paths, removed_paths = set(), set()
+                found = FoundPaths()  # everything (re)scanned, for the stats of the added paths
+                for path in directories.intersection(current):
+                    if path not in current:  # already dropped along with a removed parent
+                        continue
+                    old_snapshot = current[path]
+                    depth = search_path.search_depth
+                    if depth >= 0:
+                        depth -= len(Path(path).relative_to(root).parts)
+                    task = CrawlTask(0, path, depth, self._gitignore_chain(search_path, current, root, path))
+                    visit = self._visit(search_path, {}, task, CrawlContext(1))
+                    new_snapshot, child_gitignore = visit.snapshot, visit.child_gitignore
+                    current[path] = new_snapshot
+
+                    found.extend_found(FoundPaths.from_snapshot(path, new_snapshot))
+                    old_names, new_names = set(old_snapshot.match_names), set(new_snapshot.match_names)
+                    added_paths.update(os.path.join(path, name) for name in new_names - old_names)
+                    removed_paths.update(os.path.join(path, name) for name in old_names - new_names)
+
+                    # Subdirectories are walked afresh if they're new, or all of them if the rules that apply to them
+                    # changed
+                    old_subdirs, new_subdirs = set(old_snapshot.subdir_names), set(new_snapshot.subdir_names)
+                    if old_snapshot.gitignore_mtime_ns == new_snapshot.gitignore_mtime_ns:
+                        old_subdirs, new_subdirs = old_subdirs - new_subdirs, new_subdirs - old_subdirs
+                    for name in old_subdirs:
+                        removed_paths.update(self._drop_subtree(current, os.path.join(path, name)))
+                    # A new symlink to a directory that's already been crawled doesn't get walked a second time
+                    subtree_tasks = [CrawlTask(0, os.path.join(path, name), depth - 1, child_gitignore)
+                                     for name in new_subdirs]
+                    subtree_tasks = [task for task in subtree_tasks
+                                     if not (os.path.islink(task.path) and os.path.realpath(task.path) in current)]
+                    subtree_snapshots, subtree_results, _ = self._walk([search_path], [{}], subtree_tasks)
+                    current.update(subtree_snapshots[0])
+                    added_paths.update(subtree_results[0])
+                    found.extend_found(subtree_results[0])
+
+                # Subtrees that were walked again contribute mostly the same paths as before
+                net_added = added_paths - removed_paths
+                positions = {found_path: position for position, found_path in enumerate(found)}
+                added[index] = FoundPaths(net_added, array('q', (value for found_path in net_added
+                                                                 for value in found.stat(positions[found_path]))))
+                removed[index] = list(removed_paths - added_paths)
+
+            self.snapshots = snapshots
+
+        return added, removed
+
+    @staticmethod
+    def _drop_subtree(snapshots: dict[str, DirSnapshot], path: str) -> list[str]:
+        # Removes the snapshots for a directory and everything beneath it, returning the paths they contributed
+        dropped = []
+        stack = [path]
+        while stack:
+            path = stack.pop()
+            snapshot = snapshots.pop(path, None)
+            if snapshot is not None:
+                dropped += [os.path.join(path, name) for name in snapshot.match_names]
+                stack += [os.path.join(path, name) for name in snapshot.subdir_names]
+        return dropped
+
+    def _walk(self, search_paths: list[SearchPathEntry], previous: list[dict[str, DirSnapshot]],
+              tasks: list[CrawlTask], cached_only: bool = False, on_batch: Callable[[list[str]], None] | None = None,
+              background: bool = False, context: CrawlContext | None = None
+              ) -> tuple[list[dict[str, DirSnapshot]], list[FoundPaths], list[CrawlStats]]:
+        # Walks the trees below the tasks' directories, returning the new snapshots, the matching paths and the
+        # stats for each search path
+        if context is None:
+            context = CrawlContext(len(search_paths))
+        current = [{} for _ in search_paths]
+        results = [FoundPaths() for _ in search_paths]
+        stats = [CrawlStats(str(search_path.full_path)) for search_path in search_paths]
+        start_time = time.perf_counter()
+        batch = FoundPaths()
+        last_batch_time = 0.0
+
+        def expired(index: int) -> bool:
+            # Whether the search path has run past its deadline, marking it as timed out if so
+            if stats[index].timed_out:
+                return True
+            deadline = context.deadline(index)
+            if deadline is not None and time.perf_counter() > deadline:
+                stats[index].timed_out = True
+                stats[index].wall_time = time.perf_counter() - start_time
+            return stats[index].timed_out
+
+        def merge(task: CrawlTask, visit: Visit) -> list[CrawlTask]:
+            nonlocal batch, last_batch_time
+            snapshot = visit.snapshot
+            task_stats = stats[task.index]
+            if not task_stats.timed_out:
+                task_stats.wall_time = time.perf_counter() - start_time
+            task_stats.visit_time += visit.elapsed
+            if snapshot is None:
+                task_stats.directories_skipped += 1
+                return []
+            task_stats.directories_visited += 1
+            task_stats.entries_matched += len(snapshot.match_names)
+            task_stats.unreadable_skipped += visit.skipped_unreadable
+            if visit.scan is not None:
+                task_stats.directories_scanned += 1
+                task_stats.entries_examined += visit.scan.examined
+                task_stats.pruned_subtrees += visit.scan.pruned
+                task_stats.permission_errors += visit.scan.permission_denied
+            current[task.index][task.path] = snapshot
+            found = FoundPaths.from_snapshot(task.path, snapshot)
+            results[task.index].extend_found(found)
+
+            if on_batch is not None and found:
+                batch.extend_found(found)
+                if len(batch) >= STREAM_BATCH_SIZE or time.perf_counter() - last_batch_time >= STREAM_BATCH_INTERVAL:
+                    on_batch(batch)
+                    batch = FoundPaths()
+                    last_batch_time = time.perf_counter()
+
+            if snapshot.subdir_names and expired(task.index):
+                return []
+            links = snapshot.link_names
+            return [CrawlTask(task.index, os.path.join(task.path, name), task.depth - 1, visit.child_gitignore,
+                              visit.children_reusable, bool(links) and name in links)
+                    for name in snapshot.subdir_names]
+
+        if cached_only:
+            while tasks:
+                task = tasks.pop()
+                snapshot = previous[task.index].get(task.path) or DirSnapshot(None, task.depth != 0, [], [])
+                tasks += merge(task, Visit(snapshot, reused=True))
+        elif self.max_workers == 1 or len(tasks) == 0:
+            if background:
+                set_background_io_priority(True)
+            try:
+                deferred = []
+                while tasks or deferred:
+                    if not tasks:
+                        tasks, deferred = deferred, []
+                    task = tasks.pop()
+                    if expired(task.index):
+                        continue
+                    for child_task in merge(task, self._visit(search_paths[task.index], previous[task.index], task,
+                                                              context)):
+                        (deferred if child_task.via_link else tasks).append(child_task)
+            finally:
+                if background:
+                    set_background_io_priority(False)
+        else:
+            # The pool's threads only live as long as the crawl, so their priority doesn't need restoring
+            pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='canaveral-crawl',
+                                      initializer=set_background_io_priority if background else None)
+            pending = {}
+            overdue = set()  # search paths past their deadline, whether they finished in time or not
+            left_behind = False
+
+            def submit(task: CrawlTask) -> None:
+                if not expired(task.index):
+                    pending[pool.submit(self._visit, search_paths[task.index], previous[task.index], task,
+                                        context)] = task
+
+            try:
+                deferred = []
+                for task in tasks:
+                    submit(task)
+                while pending or deferred:
+                    if not pending:
+                        for task in deferred:
+                            submit(task)
+                        deferred = []
+                        continue
+                    deadlines = [context.deadline(index) for index in range(len(search_paths)) if index not in overdue]
+                    deadlines = [deadline for deadline in deadlines if deadline is not None]
+                    timeout = max(0.0, min(deadlines) - time.perf_counter()) if deadlines else None
+                    done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        for task in merge(pending.pop(future), future.result()):
+                            if task.via_link:
+                                deferred.append(task)
+                            else:
+                                submit(task)
+
+                    # Visits still running past their search path's deadline (e.g. stuck on a hung mount) are left
+                    # behind, and their results ignored
+                    now = time.perf_counter()
+                    newly_overdue = set()
+                    for index in range(len(search_paths)):
+                        deadline = context.deadline(index)
+                        if deadline is not None and now > deadline and index not in overdue:
+                            newly_overdue.add(index)
+                    if newly_overdue:
+                        overdue |= newly_overdue
+                        unfinished = {task.index for task in pending.values()} | {task.index for task in deferred}
+                        for index in newly_overdue & unfinished:
+                            expired(index)
+                        for future, task in list(pending.items()):
+                            if stats[task.index].timed_out:
+                                future.cancel()
+                                del pending[future]
+                                left_behind = True
+                        deferred = [task for task in deferred if not stats[task.index].timed_out]
+            finally:
+                pool.shutdown(wait=not left_behind, cancel_futures=True)
+
+        if batch:
+            on_batch(batch)
+        if not cached_only and any(search_path_stats.directories_visited for search_path_stats in stats):
+            scanned = sum(search_path_stats.directories_scanned for search_path_stats in stats)
+            visited = sum(search_path_stats.directories_visited for search_path_stats in stats)
+            logger.debug(f'Crawl: {scanned} directories scanned, {visited - scanned} unchanged, '
+                         f'{sum(search_path_stats.pruned_subtrees for search_path_stats in stats)} pruned by exclude '
+                         f'rules or .gitignore files, '
+                         f'{sum(search_path_stats.directories_skipped for search_path_stats in stats)} skipped as '
+                         f'already visited (symlinks)'
+                         + (f', {context.shared.hits} reads shared between overlapping search paths'
+                            if context.shared is not None else ''))
+        return current, results, stats
+
+    def crawl_timeout(self, search_path: SearchPathEntry) -> float | None:
+        """Seconds before a crawl of the search path is abandoned, or None for no limit (a timeout of 0 or less)"""
+        timeout = self.timeout if search_path.crawl_timeout is None else search_path.crawl_timeout
+        return timeout if timeout is not None and timeout > 0 else None
+
+    def stats_for(self, search_paths: list[SearchPathEntry]) -> list[CrawlStats | None]:
+        """The stats from the last crawl of each search path (None for any that haven't been crawled)"""
+        return [self.stats.get(self._snapshot_key(search_path)) for search_path in search_paths]
+
+    def exclude_rules(self, search_path: SearchPathEntry) -> ExcludeRules:
+        """The crawler-wide exclude rules combined with the search path's own, compiled once"""
+        patterns = tuple(self.exclude) + tuple(search_path.exclude)
+        if patterns not in self._exclude_rules:
+            self._exclude_rules[patterns] = ExcludeRules(list(patterns))
+        return self._exclude_rules[patterns]
+
+    def _snapshot_key(self, search_path: SearchPathEntry) -> tuple:
+        # Snapshots are only valid for the settings they were taken with
+        return (str(search_path.full_path), search_path.search_depth, tuple(search_path.patterns),
+                search_path.include_dirs, search_path.exclude_dotdirs, search_path.search_dotdirs,
+                self.exclude_rules(search_path).patterns, search_path.use_gitignore)
+
+    def _gitignore_rules(self, path: str, mtime_ns: int) -> GitignoreRules:
+        # Parsed .gitignore files are cached until they're modified
+        cached = self._gitignore_cache.get(path)
+        if cached is None or cached[0] != mtime_ns:
+            try:
+                rules = GitignoreRules.from_file(path)
+            except OSError:
+                rules = GitignoreRules(os.path.dirname(path), [])
+            self._gitignore_cache[path] = cached = (mtime_ns, rules)
+        return cached[1]
+
+    def _gitignore_chain(self, search_path: SearchPathEntry, snapshots: dict[str, DirSnapshot], root: str,
+                         path: str) -> tuple[GitignoreRules, ...]:
+        # The .gitignore files that apply in path's parent directory, from the root down, according to the snapshots
+        chain = ()
+        if not search_path.use_gitignore or path == root:
+            return chain
+
+        ancestor = root
+        for part in (None,) + Path(path).relative_to(root).parts[:-1]:
+            if part is not None:
+                ancestor = os.path.join(ancestor, part)
+            snapshot = snapshots.get(ancestor)
+            if snapshot is not None and snapshot.gitignore_mtime_ns is not None:
+                chain += (self._gitignore_rules(os.path.join(ancestor, '.gitignore'), snapshot.gitignore_mtime_ns),)
+        return chain
+
+    def _visit(self, search_path: SearchPathEntry, previous: dict[str, DirSnapshot], task: CrawlTask,
+               context: CrawlContext) -> Visit:
+        if context.throttle is not None:
+            context.throttle.wait()
+        start_time = time.perf_counter()
+        shared = context.shared if context.shared is not None and context.shared.covers(task.path) else None
+        descend = task.depth != 0
+        try:
+            stat = shared.stat(task.path) if shared is not None else os.stat(task.path)
+        except OSError:
+            mtime_ns = None
+        else:
+            if not context.first_visit(task.index, stat):
+                return Visit(None, elapsed=time.perf_counter() - start_time)
+            mtime_ns = stat.st_mtime_ns
+
+        snapshot = previous.get(task.path) if task.reuse else None
+        if snapshot is not None and snapshot.unreadable_skips > 0:
+            return Visit(replace(snapshot, unreadable_skips=snapshot.unreadable_skips - 1), reused=True,
+                         elapsed=time.perf_counter() - start_time, skipped_unreadable=True)
+        unchanged = snapshot is not None and mtime_ns is not None and \
+            snapshot.mtime_ns == mtime_ns and snapshot.descended == descend
+
+        # Adding or removing a .gitignore changes the directory's mtime, but editing one doesn't, so its own mtime
+        # has to be checked if there is one
+        gitignore = task.gitignore
+        gitignore_mtime_ns = None
+        if search_path.use_gitignore and not (unchanged and snapshot.gitignore_mtime_ns is None):
+            gitignore_path = os.path.join(task.path, '.gitignore')
+            try:
+                gitignore_mtime_ns = os.stat(gitignore_path).st_mtime_ns
+                gitignore += (self._gitignore_rules(gitignore_path, gitignore_mtime_ns),)
+            except OSError:
+                pass
+
+        if unchanged and snapshot.gitignore_mtime_ns == gitignore_mtime_ns:
+            return Visit(snapshot, reused=True, elapsed=time.perf_counter() - start_time, child_gitignore=gitignore)
+        children_reusable = task.reuse and (snapshot is None or snapshot.gitignore_mtime_ns == gitignore_mtime_ns)
+
+        scan = scan_directory(task.path, descend=descend,
+                              patterns=search_path.matcher,
+                              include_dirs=search_path.include_dirs,
+                              exclude_dotdirs=search_path.exclude_dotdirs,
+                              search_dotdirs=search_path.search_dotdirs,
+                              exclude=self.exclude_rules(search_path),
+                              root=search_path.full_path,
+                              gitignore=gitignore if search_path.use_gitignore else None,
+                              listing=shared.scandir if shared is not None else None)
+        unreadable_skips = 0
+        if scan.permission_denied:
+            logger.trace(f'Permission denied: {task.path}')
+            # Changing a directory's permissions doesn't change its mtime, so it's retried after a while instead
+            mtime_ns = None
+            unreadable_skips = self.unreadable_retry_interval
+        if mtime_ns is not None and time.time_ns() - mtime_ns < RACY_MTIME_WINDOW_NS:
+            mtime_ns = None
+        snapshot = DirSnapshot(mtime_ns, descend, [entry.name for entry in scan.matches],
+                               [entry.name for entry in scan.subdirs], gitignore_mtime_ns,
+                               [entry.name for entry in scan.subdirs if entry.is_symlink()],
+                               entry_stats(scan.matches), unreadable_skips)
+        return Visit(snapshot, scan=scan, elapsed=time.perf_counter() - start_time, child_gitignore=gitignore,
+                     children_reusable=children_reusable)
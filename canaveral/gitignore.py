@@ -0,0 +1,132 @@
+"""
+.gitignore parsing & matching, so the crawler can skip files that git ignores (build output, virtual environments,
+caches...) in search paths that contain git checkouts.
+
+Follows the gitignore(5) rules: blank lines and '#' comments are skipped, '!' re-includes, a trailing '/' only
+matches directories, a pattern containing a '/' (other than at the end) is anchored to the directory containing the
+.gitignore, '**' matches across directories, and the last matching pattern wins, with patterns in deeper .gitignore
+files taking precedence. Since ignored directories are never descended into, nothing inside one can be re-included,
+also as in git. Only .gitignore files at or below a search path root are read (not ones in parent directories,
+.git/info/exclude or core.excludesFile).
+"""
+from __future__ import annotations
+
+import os
+import re
+from typing import Iterable
+
+
+def translate(pattern: str) -> str:
+    """Translates a gitignore glob (without the leading '!', or any leading or trailing '/') into a regex"""
+    result = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            j = i
+            while j < n and pattern[j] == '*':
+                j += 1
+            whole_segment = (i == 0 or pattern[i - 1] == '/') and (j == n or pattern[j] == '/')
+            if j - i >= 2 and whole_segment:
+                if j == n:  # trailing '/**': everything inside
+                    result.append('.*')
+                else:  # leading or middle '**/': zero or more directories
+                    result.append('(?:.*/)?')
+                    j += 1
+            else:
+                result.append('[^/]*')
+            i = j
+            continue
+        elif c == '?':
+            result.append('[^/]')
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:  # no closing bracket, so it's a literal '['
+                result.append(re.escape(c))
+            else:
+                contents = pattern[i + 1:j].replace('\\', '\\\\')
+                if contents[0] in '!^':
+                    contents = '^' + contents[1:]
+                result.append(f'[{contents}]')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            result.append(re.escape(pattern[i]))
+        else:
+            result.append(re.escape(c))
+        i += 1
+    return ''.join(result)
+
+
+class GitignoreRules:
+    """The patterns from a single .gitignore file, matched against paths relative to the directory holding it"""
+    base_dir: str
+    rules: list[tuple[re.Pattern, bool, bool]]  # (regex, negated, directories only)
+
+    def __init__(self, base_dir: str, lines: Iterable[str]):
+        self.base_dir = base_dir
+        self._relative_start = len(os.path.join(base_dir, ''))
+        self.rules = []
+
+        for line in lines:
+            line = line.rstrip('\r\n')
+            # Trailing spaces are ignored unless escaped with a backslash
+            stripped = line.rstrip(' ')
+            if stripped.endswith('\\') and len(stripped) < len(line):
+                stripped += ' '
+            line = stripped
+            if not line or line.startswith('#'):
+                continue
+
+            negated = line.startswith('!')
+            if negated:
+                line = line[1:]
+            elif line.startswith('\\'):  # escaped leading '!' or '#'
+                line = line[1:]
+
+            directories_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+
+            if '/' in line:
+                regex = translate(line.lstrip('/'))
+            else:
+                regex = '(?:.*/)?' + translate(line)
+            self.rules.append((re.compile(regex, re.DOTALL), negated, directories_only))
+
+    def __repr__(self):
+        return f"GitignoreRules(base_dir='{self.base_dir}'): {len(self.rules)} rules"
+
+    @classmethod
+    def from_file(cls, path: str) -> GitignoreRules:
+        with open(path, 'r', encoding='utf-8', errors='replace') as file:
+            return cls(os.path.dirname(path), file)
+
+    def match(self, path: str, is_dir: bool) -> bool | None:
+        """True if the path is ignored, False if it's explicitly re-included, None if no pattern matches it"""
+        relative_path = path[self._relative_start:]
+        if os.sep != '/':
+            relative_path = relative_path.replace(os.sep, '/')
+
+        for regex, negated, directories_only in reversed(self.rules):
+            if directories_only and not is_dir:
+                continue
+            if regex.fullmatch(relative_path):
+                return not negated
+        return None
+
+
+def is_ignored(chain: tuple[GitignoreRules, ...], path: str, is_dir: bool) -> bool:
+    """Whether path is ignored by a chain of .gitignore files, ordered from the outermost directory inwards"""
+    for rules in reversed(chain):
+        result = rules.match(path, is_dir)
+        if result is not None:
+            return result
+    return False
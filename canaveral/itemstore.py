@@ -0,0 +1,502 @@
+"""
+Compact storage for the catalog's items. At several hundred thousand items, an object per item (a Path plus separate
+name & lower-case name strings) costs hundreds of bytes each and gives the garbage collector a large object graph to
+walk, so the items are kept as parallel arrays instead, and referred to by integer id:
+
+    directories:  interned parent directory strings, one per directory that holds any item
+    parents:      directory id per item
+    names:        item names, packed into one string per block of BLOCK_SIZE items, with an array of offsets
+    search keys:  the same for the items' search keys, which queries match against (see canaveral.searchkey)
+    key offsets:  for the few keys that don't line up with their names, the name position of each key character
+    char index:   each search key's characters in sorted order, with the key position of each, so the occurrences of
+                  a character after a position can be found by bisection (see find_positions), packed like the names
+    char masks:   a bitmask per item of the characters in its search key (see char_mask), to reject items that can't
+                  match a query without looking at their keys
+    postings:     for each character, the ids of the items whose search keys contain it, in id order
+    mtimes:       modification time of each item, in seconds (0 if unknown), as captured by the crawler
+    sizes:        size of each item in bytes, DIRECTORY_SIZE for directories
+    hashes:       a hash of each item's path, for an open-addressing table from path to item id
+
+The store is append-only, so ids stay valid for as long as the store exists and can be shared between catalog
+versions. An item that leaves the catalog and comes back later gets its old id again. Path objects are only built
+when asked for, e.g. when an item is displayed or launched.
+
+Working out the search keys, character indexes, masks & postings is most of the cost of adding an item, so the
+catalog snapshot keeps them: columns gives a set of items as StoreColumns, and from_columns makes a store from them
+again without recomputing anything. Only the path hashes are recomputed, as str hashes differ between runs.
+
+Adding items is thread-safe. Reads don't take the lock: an item's fields are written before its id is handed out,
+and a block of names is swapped for its packed form in a single assignment.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from itertools import accumulate
+from pathlib import Path
+from typing import Iterable
+
+from canaveral.crawler import DIRECTORY_SIZE, FoundPaths
+from canaveral.searchkey import search_key_with_offsets
+
+BLOCK_SIZE = 4096  # items per packed block of names
+MIN_TABLE_SIZE = 1024
+EMPTY_SLOT = -1
+EMPTY_POSTING = array('I')
+
+
+def char_mask(text: str) -> int:
+    """
+    A bitmask of the characters in text: a bit each for a-z & 0-9, with any other character sharing one of the
+    remaining 28 bits. Items whose masks lack any of a query's bits can't match it (the reverse needn't hold).
+    """
+    mask = 0
+    for char in text:
+        if 'a' <= char <= 'z':
+            mask |= 1 << (ord(char) - 97)
+        elif '0' <= char <= '9':
+            mask |= 1 << (ord(char) - 22)
+        else:
+            mask |= 1 << (36 + ord(char) % 28)
+    return mask
+
+
+def _pack(names: list[str]) -> tuple[str, array]:
+    return ''.join(names), array('I', accumulate(map(len, names), initial=0))
+
+
+class _NameColumn:
+    """Strings stored in blocks, each packed into one string plus offsets once it's full"""
+
+    def __init__(self):
+        self.blocks: list[list[str] | tuple[str, array]] = []
+
+    @classmethod
+    def from_strings(cls, strings: list[str]) -> _NameColumn:
+        column = cls()
+        for start in range(0, len(strings), BLOCK_SIZE):
+            block = strings[start:start + BLOCK_SIZE]
+            column.blocks.append(_pack(block) if len(block) == BLOCK_SIZE else block)
+        return column
+
+    def append(self, index: int, name: str) -> None:
+        block_index, position = divmod(index, BLOCK_SIZE)
+        if position == 0:
+            self.blocks.append([])
+        block = self.blocks[block_index]
+        block.append(name)
+        if len(block) == BLOCK_SIZE:
+            self.blocks[block_index] = _pack(block)
+
+    def __getitem__(self, index: int) -> str:
+        block_index, position = divmod(index, BLOCK_SIZE)
+        block = self.blocks[block_index]
+        if type(block) is list:
+            return block[position]
+        blob, offsets = block
+        return blob[offsets[position]:offsets[position + 1]]
+
+    @property
+    def nbytes(self) -> int:
+        total = sys.getsizeof(self.blocks)
+        for block in self.blocks:
+            if type(block) is list:
+                total += sys.getsizeof(block) + sum(sys.getsizeof(name) for name in block)
+            else:
+                blob, offsets = block
+                total += sys.getsizeof(block) + sys.getsizeof(blob) + sys.getsizeof(offsets)
+        return total
+
+
+def _position_typecode(length: int) -> str:
+    # Nearly all names are under 256 characters, so their positions fit in a byte
+    return 'B' if length <= 256 else 'H'
+
+
+class _CharIndexColumn:
+    """
+    Character position indexes, stored in blocks like _NameColumn. An item's index is its search key's characters
+    sorted (stably, so each character's positions are in order) along with their positions in the key.
+    """
+
+    def __init__(self):
+        self.blocks: list[list[tuple[str, array]] | tuple[str, array, array]] = []
+
+    @classmethod
+    def from_index(cls, chars: list[str], positions: array) -> _CharIndexColumn:
+        """A column from each item's sorted characters, and their positions (concatenated in item order)"""
+        column = cls()
+        start = 0
+        for block_start in range(0, len(chars), BLOCK_SIZE):
+            block = chars[block_start:block_start + BLOCK_SIZE]
+            block_chars, offsets = _pack(block)
+            block_positions = positions[start:start + len(block_chars)]
+            start += len(block_chars)
+            if len(block) == BLOCK_SIZE:
+                column.blocks.append((block_chars, array(_position_typecode(max(map(len, block))), block_positions),
+                                      offsets))
+            else:
+                column.blocks.append([(item_chars, array(_position_typecode(len(item_chars)),
+                                                         block_positions[offsets[i]:offsets[i + 1]]))
+                                      for i, item_chars in enumerate(block)])
+        return column
+
+    def append(self, index: int, key: str) -> None:
+        block_index, position = divmod(index, BLOCK_SIZE)
+        if position == 0:
+            self.blocks.append([])
+        block = self.blocks[block_index]
+        order = sorted(range(len(key)), key=key.__getitem__)
+        block.append((''.join([key[i] for i in order]), array(_position_typecode(len(key)), order)))
+        if len(block) == BLOCK_SIZE:
+            chars, offsets = _pack([chars for chars, _ in block])
+            positions = array(_position_typecode(max(len(chars) for chars, _ in block)),
+                              [position for _, item_positions in block for position in item_positions])
+            self.blocks[block_index] = (chars, positions, offsets)
+
+    def __getitem__(self, index: int) -> tuple[str, array, int, int]:
+        # Returns (chars, positions, start, end): the item's index is chars[start:end] & positions[start:end]
+        block_index, position = divmod(index, BLOCK_SIZE)
+        block = self.blocks[block_index]
+        if type(block) is list:
+            chars, positions = block[position]
+            return chars, positions, 0, len(chars)
+        chars, positions, offsets = block
+        return chars, positions, offsets[position], offsets[position + 1]
+
+    @property
+    def nbytes(self) -> int:
+        total = sys.getsizeof(self.blocks)
+        for block in self.blocks:
+            if type(block) is list:
+                for entry in block:
+                    total += sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+                total += sys.getsizeof(block)
+            else:
+                total += sys.getsizeof(block) + sum(sys.getsizeof(part) for part in block)
+        return total
+
+
+def find_positions(char_index: tuple[str, array, int, int], char: str, after: int = -1) -> array:
+    """The positions of char in an item's search key that come after the given one, from ItemStore.char_index"""
+    chars, positions, start, end = char_index
+    low = chars.find(char, start, end)  # the characters are sorted, so their run can be found by searching both ways
+    if low < 0:
+        return positions[0:0]
+    high = chars.rfind(char, low, end) + 1
+    if after >= 0:
+        low = bisect_right(positions, after, low, high)
+    return positions[low:high]
+
+
+@dataclass
+class StoreColumns:
+    """
+    A set of items from an ItemStore as flat columns, e.g. for saving in a catalog snapshot, with the items numbered
+    from 0 in the order they're listed. Each item's character index positions & key offsets are concatenated in item
+    order, and are as long as its search key.
+    """
+    directories: list[str]
+    parents: array  # of indexes into directories
+    names: list[str]
+    search_keys: list[str]
+    index_chars: list[str]  # each search key's characters, sorted
+    index_positions: array  # their positions in the search key, as 'H'
+    offset_items: array  # the items with key offsets
+    key_offsets: array
+    char_masks: array
+    mtimes: array
+    sizes: array
+    posting_chars: str
+    posting_lengths: array
+    postings: array
+
+
+class ItemStore:
+    """Catalog items as parallel arrays, referred to by id. See the module docstring."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._directories: list[str] = []
+        self._directory_ids: dict[str, int] = {}
+        self._parents = array('I')
+        self._names = _NameColumn()
+        self._search_keys = _NameColumn()
+        self._key_offsets: dict[int, array] = {}
+        self._char_index = _CharIndexColumn()
+        self._char_masks = array('Q')
+        self._postings: dict[str, array] = {}
+        self._hashes = array('q')
+        self._mtimes = array('q')
+        self._sizes = array('q')
+        self._table = array('q', [EMPTY_SLOT]) * MIN_TABLE_SIZE
+
+    def __repr__(self):
+        return f'ItemStore: {len(self)} items in {len(self._directories)} directories, {self.nbytes} bytes'
+
+    def __len__(self) -> int:
+        return len(self._parents)
+
+    @staticmethod
+    def _split(path: str) -> tuple[str, str]:
+        directory, name = os.path.split(path)
+        if not name:  # a filesystem root, e.g. '/' or 'C:\'
+            return '', directory
+        return directory, name
+
+    def _find(self, directory_id: int, name: str, path_hash: int) -> tuple[int, int]:
+        # Returns (item id or EMPTY_SLOT, the slot where it is or would go)
+        table = self._table
+        mask = len(table) - 1
+        slot = path_hash & mask
+        while True:
+            item_id = table[slot]
+            if item_id == EMPTY_SLOT or (self._hashes[item_id] == path_hash and
+                                         self._parents[item_id] == directory_id and self._names[item_id] == name):
+                return item_id, slot
+            slot = (slot + 1) & mask
+
+    def _grow_table(self, size: int | None = None) -> None:
+        table = array('q', [EMPTY_SLOT]) * (size or 2 * len(self._table))
+        mask = len(table) - 1
+        for item_id, path_hash in enumerate(self._hashes):
+            slot = path_hash & mask
+            while table[slot] != EMPTY_SLOT:
+                slot = (slot + 1) & mask
+            table[slot] = item_id
+        self._table = table
+
+    def add(self, path: str) -> int:
+        """The id of the item at path, adding it if it's not in the store yet"""
+        directory, name = self._split(path)
+        with self._lock:
+            directory_id = self._directory_ids.get(directory)
+            if directory_id is None:
+                directory_id = self._directory_ids[directory] = len(self._directories)
+                self._directories.append(directory)
+
+            path_hash = hash((directory_id, name))
+            item_id, slot = self._find(directory_id, name, path_hash)
+            if item_id != EMPTY_SLOT:
+                return item_id
+
+            item_id = len(self._parents)
+            self._names.append(item_id, name)
+            key, offsets = search_key_with_offsets(name)
+            self._search_keys.append(item_id, key)
+            self._char_index.append(item_id, key)
+            self._char_masks.append(char_mask(key))
+            for char in set(key):
+                posting = self._postings.get(char)
+                if posting is None:
+                    posting = self._postings[char] = array('I')
+                posting.append(item_id)
+            if offsets is not None:
+                self._key_offsets[item_id] = offsets
+            self._hashes.append(path_hash)
+            self._mtimes.append(0)
+            self._sizes.append(0)
+            self._parents.append(directory_id)  # last, as len(self._parents) is the published item count
+            self._table[slot] = item_id
+            # Kept at most half full, so probe sequences stay short
+            if 2 * len(self._parents) > len(self._table):
+                self._grow_table()
+            return item_id
+
+    def add_found(self, found_paths: list[str]) -> list[int]:
+        """
+        The ids of found_paths, adding any that aren't in the store yet. If they came from the crawler (as
+        FoundPaths), their stats are recorded too.
+        """
+        item_ids = [self.add(path) for path in found_paths]
+        if isinstance(found_paths, FoundPaths):
+            stats = found_paths.stats
+            for position, item_id in enumerate(item_ids):
+                self._mtimes[item_id] = stats[2 * position]
+                self._sizes[item_id] = stats[2 * position + 1]
+        return item_ids
+
+    def columns(self, item_ids: list[int]) -> StoreColumns:
+        """The given items (ids in increasing order) as StoreColumns, renumbered from 0"""
+        directory_ids = {}
+        parents = array('I')
+        for item_id in item_ids:
+            parents.append(directory_ids.setdefault(self._parents[item_id], len(directory_ids)))
+        search_keys = [self._search_keys[item_id] for item_id in item_ids]
+        index_chars = []
+        index_positions = array('H')
+        for item_id in item_ids:
+            chars, positions, start, end = self._char_index[item_id]
+            index_chars.append(chars[start:end])
+            index_positions.extend(positions[start:end].tolist())  # may be 'B'
+
+        new_ids = {item_id: new_id for new_id, item_id in enumerate(item_ids)}
+        offset_items = array('I', sorted(new_ids[item_id] for item_id in list(self._key_offsets) if item_id in new_ids))
+        key_offsets = array('I')
+        for new_id in offset_items:
+            key_offsets.extend(self._key_offsets[item_ids[new_id]])
+        # Ids are renumbered in the same order, so the postings stay in id order
+        postings = {char: array('I', [new_ids[item_id] for item_id in posting if item_id in new_ids])
+                    for char, posting in list(self._postings.items())}
+        postings = {char: posting for char, posting in postings.items() if posting}
+        all_postings = array('I')
+        for posting in postings.values():
+            all_postings.extend(posting)
+        return StoreColumns(directories=[self._directories[directory_id] for directory_id in directory_ids],
+                            parents=parents,
+                            names=[self._names[item_id] for item_id in item_ids],
+                            search_keys=search_keys,
+                            index_chars=index_chars,
+                            index_positions=index_positions,
+                            offset_items=offset_items,
+                            key_offsets=key_offsets,
+                            char_masks=array('Q', [self._char_masks[item_id] for item_id in item_ids]),
+                            mtimes=array('q', [self._mtimes[item_id] for item_id in item_ids]),
+                            sizes=array('q', [self._sizes[item_id] for item_id in item_ids]),
+                            posting_chars=''.join(postings),
+                            posting_lengths=array('I', map(len, postings.values())),
+                            postings=all_postings)
+
+    @classmethod
+    def from_columns(cls, columns: StoreColumns) -> ItemStore:
+        """A store holding the items in columns, with the same ids"""
+        store = cls()
+        store._directories = list(columns.directories)
+        store._directory_ids = {directory: directory_id for directory_id, directory in enumerate(store._directories)}
+        store._names = _NameColumn.from_strings(columns.names)
+        store._search_keys = _NameColumn.from_strings(columns.search_keys)
+        store._char_index = _CharIndexColumn.from_index(columns.index_chars, columns.index_positions)
+        key_lengths = [len(columns.search_keys[item_id]) for item_id in columns.offset_items]
+        starts = accumulate(key_lengths, initial=0)
+        store._key_offsets = {item_id: columns.key_offsets[start:start + length]
+                              for item_id, start, length in zip(columns.offset_items, starts, key_lengths)}
+        store._char_masks = columns.char_masks
+        ends = accumulate(columns.posting_lengths)
+        starts = accumulate(columns.posting_lengths, initial=0)
+        store._postings = {char: columns.postings[start:end]
+                           for char, start, end in zip(columns.posting_chars, starts, ends)}
+        store._hashes = array('q', map(hash, zip(columns.parents, columns.names)))
+        store._mtimes = columns.mtimes
+        store._sizes = columns.sizes
+        store._parents = columns.parents
+        size = MIN_TABLE_SIZE
+        while size < 2 * len(store._parents):
+            size *= 2
+        store._grow_table(size)
+        return store
+
+    def lookup(self, path: str) -> int | None:
+        """The id of the item at path, or None if it's not in the store"""
+        directory, name = self._split(path)
+        with self._lock:
+            directory_id = self._directory_ids.get(directory)
+            if directory_id is None:
+                return None
+            item_id, _ = self._find(directory_id, name, hash((directory_id, name)))
+        return None if item_id == EMPTY_SLOT else item_id
+
+    def name(self, item_id: int) -> str:
+        return self._names[item_id]
+
+    def search_key(self, item_id: int) -> str:
+        return self._search_keys[item_id]
+
+    def char_index(self, item_id: int) -> tuple[str, array, int, int]:
+        """The item's character position index, for find_positions"""
+        return self._char_index[item_id]
+
+    def char_mask(self, item_id: int) -> int:
+        return self._char_masks[item_id]
+
+    def posting(self, char: str) -> array:
+        """The ids of the items whose search keys contain char, in id order. Don't modify it."""
+        return self._postings.get(char, EMPTY_POSTING)
+
+    def with_chars(self, item_ids: Iterable[int], text: str) -> list[int]:
+        """The item_ids whose search keys might contain all the characters of text (judging by their masks)"""
+        mask = char_mask(text)
+        masks = self._char_masks
+        return [item_id for item_id in item_ids if masks[item_id] & mask == mask]
+
+    def key_offsets(self, item_id: int) -> array | None:
+        """The name position of each character of the item's search key, or None if they're the same positions"""
+        return self._key_offsets.get(item_id)
+
+    def mtime(self, item_id: int) -> int:
+        return self._mtimes[item_id]
+
+    def size(self, item_id: int) -> int:
+        return self._sizes[item_id]
+
+    def is_dir(self, item_id: int) -> bool:
+        return self._sizes[item_id] == DIRECTORY_SIZE
+
+    def directory(self, item_id: int) -> str:
+        return self._directories[self._parents[item_id]]
+
+    def path(self, item_id: int) -> str:
+        directory = self._directories[self._parents[item_id]]
+        name = self._names[item_id]
+        return os.path.join(directory, name) if directory else name
+
+    def item(self, item_id: int) -> CatalogItem:
+        return CatalogItem(self, item_id)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the store, in bytes"""
+        return (sys.getsizeof(self._directories) + sum(sys.getsizeof(directory) for directory in self._directories) +
+                sys.getsizeof(self._directory_ids) + self._names.nbytes + self._search_keys.nbytes +
+                sys.getsizeof(self._key_offsets) + sum(map(sys.getsizeof, self._key_offsets.values())) +
+                self._char_index.nbytes + sys.getsizeof(self._char_masks) + sys.getsizeof(self._postings) +
+                sum(map(sys.getsizeof, self._postings.values())) +
+                sys.getsizeof(self._parents) + sys.getsizeof(self._hashes) + sys.getsizeof(self._mtimes) +
+                sys.getsizeof(self._sizes) + sys.getsizeof(self._table))
+
+
+class CatalogItem:
+    """
+    An item in a catalog: a lightweight handle on its entry in an ItemStore. Items compare equal if they have the
+    same path, even from different stores, so they can be used in sets & as dict keys. The name & path are read from
+    the store when needed.
+    """
+    __slots__ = ('store', 'id')
+    store: ItemStore
+    id: int
+
+    def __init__(self, store: ItemStore, item_id: int):
+        self.store = store
+        self.id = item_id
+
+    def __repr__(self):
+        return f"CatalogItem(full_path='{self.path}')"
+
+    def __eq__(self, other):
+        if not isinstance(other, CatalogItem):
+            return NotImplemented
+        if self.store is other.store:
+            return self.id == other.id
+        return self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    @property
+    def name(self) -> str:
+        return self.store.name(self.id)
+
+    @property
+    def search_key(self) -> str:
+        return self.store.search_key(self.id)
+
+    @property
+    def path(self) -> str:
+        return self.store.path(self.id)
+
+    @property
+    def full_path(self) -> Path:
+        return Path(self.store.path(self.id))
@@ -15,7 +15,7 @@ from appdirs import AppDirs
 # Try different ways of importing, so we can run this as an application installed via pip/pipx,
 # and also just from the source directory.
 from canaveral.basemodels import SearchPathEntry, Catalog
-from canaveral.qtmodels import LaunchListModel
+from canaveral.qtmodels import LaunchListModel, CatalogRefresher, CatalogWatcher
 from canaveral.widgets import CharLineEdit, CharListWidget
 from canaveral.qtkeybind import keybinder
 
@@ -42,6 +42,12 @@ def load_search_paths(paths_file_path: Path | str) -> list[SearchPathEntry]:
     return [SearchPathEntry(**entry) for entry in entries]
 
 
+def load_catalog_settings(paths_file_path: Path | str) -> dict:
+    """Optional [catalog] table in paths.toml, passed through to Catalog as keyword arguments"""
+    with open(paths_file_path, 'rb') as f:
+        return tomllib.load(f).get('catalog', {})
+
+
 class CanaveralWindow(QMainWindow):
     """Application's main window (the search window)"""
 
@@ -61,9 +67,14 @@ class CanaveralWindow(QMainWindow):
             self.search_path_entries = load_search_paths(Path(DIRS.user_data_dir) / 'paths.toml')
             logger.debug('Loaded search path entries from new paths.toml.')
 
-        self.catalog = Catalog(self.search_path_entries, launch_data_file=Path(DIRS.user_data_dir) / 'launch_data.txt')
+        self.catalog_settings = load_catalog_settings(Path(DIRS.user_data_dir) / 'paths.toml')
+        self.catalog = Catalog(self.search_path_entries, launch_data_file=Path(DIRS.user_data_dir) / 'launch_data.txt',
+                               snapshot_file=Path(DIRS.user_data_dir) / 'catalog.snapshot', refresh=False,
+                               **self.catalog_settings)
 
         self.model = LaunchListModel(catalog=self.catalog, max_launch_list_entries=10)
+        self.catalog_refresher = CatalogRefresher(catalog=self.catalog)
+        self.catalog_refresher.catalog_updated.connect(self.refresh_query)
 
         self.setup()
         self.setup_sys_tray_icon()
@@ -72,11 +83,25 @@ class CanaveralWindow(QMainWindow):
         self.update_launch_list_size()
         self.line_input.textEdited.connect(self.update_query)
 
+        # Each search path is refreshed on its own schedule, so check for due ones as often as the shortest interval
         self.item_refresh_timer = QtCore.QTimer(self)
-        self.item_refresh_timer.setInterval(5*60*1000)  # 5 minutes
-        self.item_refresh_timer.timeout.connect(self.catalog.refresh_items_list)
+        self.item_refresh_timer.setInterval(int(min(self.catalog.refresh_intervals,
+                                                    default=self.catalog.refresh_interval) * 1000))
+        self.item_refresh_timer.timeout.connect(self.refresh_due_search_paths)
+
+        # Apply filesystem changes as they happen where possible, otherwise fall back to refreshing on a timer. The
+        # timer runs either way, as search paths whose crawl timed out aren't fully watched and still need retrying
+        self.catalog_watcher = CatalogWatcher(catalog=self.catalog)
+        self.catalog_watcher.catalog_updated.connect(self.refresh_query)
+        self.catalog_watcher.rescan_needed.connect(self.catalog_refresher.start_background)
+        self.catalog_refresher.catalog_updated.connect(self.catalog_watcher.sync)
+        self.catalog_watcher.start()
         self.item_refresh_timer.start()
 
+        # Queries are served from the snapshot (if there is one) straight away, while the catalog is brought up to
+        # date with the filesystem in the background, streaming in items as they're found
+        self.catalog_refresher.start()
+
         # Install a native event filter to receive events from the OS
         keybinder.init()
         keybinder.register_hotkey(self.winId(), "Ctrl+Alt+Space", self.show_main_window_and_focus)
@@ -181,6 +206,14 @@ class CanaveralWindow(QMainWindow):
         self.model.set_query(query_text)
         self.update_launch_list_size()
 
+    def refresh_query(self):
+        if self.model.refresh():
+            self.update_launch_list_size()
+
+    def refresh_due_search_paths(self):
+        # While watching, only the search paths whose crawl timed out need refreshing
+        self.catalog_refresher.start_due(timed_out_only=self.catalog_watcher.watching)
+
     def hide_main_window(self):
         self.launch_list_view.hide()
         self.hide()
@@ -249,6 +282,8 @@ class CanaveralWindow(QMainWindow):
             win32api.ShellExecute(0, None, str(item.full_path), '', '', 1)
 
             self.catalog.update_launch_data(query_string=self.line_input.text(), new_launch_choice=item.full_path)
+            # The launch changes scores without a new catalog version, so the list has to be re-ranked here
+            self.model.set_query(self.model.query_string)
 
         elif key in (Qt.Key_Down, Qt.Key_Up, Qt.Key_PageDown, Qt.Key_PageUp):
             if self.launch_list_view.isVisible():
@@ -1,9 +1,12 @@
+import threading
+
 from PySide6 import QtCore, QtGui, QtWidgets, QtUiTools
 from PySide6.QtCore import Qt
 
 from loguru import logger
 
-from canaveral.basemodels import Catalog, Query
+from canaveral.basemodels import Catalog, CatalogVersion, LetterQueries, Query, ScoreResult
+from canaveral.watcher import InotifyWatcher, WatchLimitReached, EventsLost
 
 
 class LaunchListModel(QtCore.QAbstractListModel):
@@ -13,29 +16,47 @@ class LaunchListModel(QtCore.QAbstractListModel):
     """
     catalog: Catalog
     query: Query | None
+    results: tuple[ScoreResult, ...]  # the rows shown, as of when the query was set, so they don't change under it
+    result_count: int  # how many results there were in all
+    generation: int  # of the catalog version the results came from
 
     def __init__(self, *args, catalog: Catalog, max_launch_list_entries=10, **kwargs):
         super(LaunchListModel, self).__init__(*args, **kwargs)
         self.query_string = None
         self.query = None
+        self.results = ()
+        self.result_count = 0
         self.catalog = catalog
+        self.generation = catalog.generation
         self.max_launch_list_entries = max_launch_list_entries
 
         # self.mime_database = QtCore.QMimeDatabase()
         self.file_icon_provider = QtWidgets.QFileIconProvider()
 
     def set_query(self, query_string: str | None):
-        if query_string in [None, '']:
-            self.query_string = None
-            self.query = None
+        self.query_string = query_string or None
+        # A query string can fold to an empty search key (e.g. a lone accent), which has no query either
+        self.query = self.catalog.query(query_string) if query_string else None
+        if self.query is None:
+            self.results = ()
+            self.result_count = 0
         else:
-            self.query_string = query_string
-            self.query = self.catalog.query(query_string)
+            # Only the rows that can be shown are ranked, which is much cheaper than sorting every result
+            self.results = self.query.top(self.max_launch_list_entries)
+            self.result_count = len(self.query.score_results)
+        self.generation = self.catalog.generation
         self.layoutChanged.emit()
 
+    def refresh(self) -> bool:
+        """Re-runs the query if a new catalog version has been installed since it was set, returning whether it was"""
+        if self.generation == self.catalog.generation:
+            return False
+        self.set_query(self.query_string)
+        return True
+
     def data(self, index: QtCore.QModelIndex | QtCore.QPersistentModelIndex,
              role: int = QtCore.Qt.ItemDataRole.DisplayRole):
-        score_result = self.query.sorted_score_results[index.row()]
+        score_result = self.results[index.row()]
 
         if role == Qt.DisplayRole:
             if score_result.item.full_path.suffix == '.lnk':
@@ -44,12 +65,12 @@ class LaunchListModel(QtCore.QAbstractListModel):
                 return score_result.item.name
 
         elif role == Qt.DecorationRole:
-            info = QtCore.QFileInfo(str(score_result.item.full_path))
+            info = QtCore.QFileInfo(score_result.item.path)
 
             return self.file_icon_provider.icon(info)
 
         elif role == Qt.ToolTipRole:
-            return str(score_result.item.full_path)
+            return score_result.item.path
 
         elif role == Qt.SizeHintRole:
             return QtCore.QSize(36, 36)
@@ -74,7 +95,192 @@ class LaunchListModel(QtCore.QAbstractListModel):
         return min(self.num_results(), self.max_launch_list_entries)
 
     def num_results(self):
-        if self.query is None:
-            return 0
+        return self.result_count
+
+
+class CatalogRefresher(QtCore.QObject):
+    """
+    Crawls the catalog's search paths and builds new catalog versions from the results on a background thread, then
+    hands each version to the GUI thread (via a queued signal) to be installed. Items are streamed into the catalog
+    in batches while a full crawl is running, so results show up long before a large crawl finishes. Refreshes of
+    individual search paths (see start_due) crawl them one at a time, swapping each one's partition in as soon as
+    it's done. Emits catalog_updated whenever a new version is installed.
+
+    The queries for each letter are built on the background thread too (before the crawl, for a catalog loaded from
+    a snapshot, and after it), as building them for a large catalog would freeze the GUI for seconds.
+    """
+    catalog: Catalog
+    version_built = QtCore.Signal(object)
+    letter_queries_built = QtCore.Signal(object)
+    catalog_updated = QtCore.Signal()
+
+    def __init__(self, *args, catalog: Catalog, **kwargs):
+        super(CatalogRefresher, self).__init__(*args, **kwargs)
+        self.catalog = catalog
+        self._worker = None
+        self.version_built.connect(self.install_version)
+        self.letter_queries_built.connect(self.install_letter_queries)
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and self._worker.is_alive()
+
+    def start(self, incremental: bool = True, background: bool = False, indices: list[int] | None = None) -> None:
+        """
+        Starts a refresh of all the search paths (or those at the given indices), unless one is already running.
+        Background refreshes are throttled (see Catalog).
+        """
+        if self.running:
+            logger.debug('Catalog refresh already running')
+            return
+
+        self._worker = threading.Thread(target=self.run, args=(incremental, background, indices),
+                                        name='canaveral-refresh', daemon=True)
+        self._worker.start()
+
+    @QtCore.Slot()
+    def start_background(self) -> None:
+        self.start(background=True)
+
+    @QtCore.Slot()
+    def start_due(self, timed_out_only: bool = False) -> None:
+        """
+        Starts a background refresh of the search paths whose refresh interval has passed (with timed_out_only=True,
+        just those whose last crawl timed out), if there are any
+        """
+        if self.running:
+            return
+        indices = self.catalog.due_search_paths(timed_out_only)
+        if indices:
+            self.start(background=True, indices=indices)
+
+    def run(self, incremental: bool, background: bool, indices: list[int] | None) -> None:
+        self.build_letter_queries()
+        if indices is None:
+            logger.debug('Refreshing catalog items list in the background')
+            self.version_built.emit(self.catalog.crawl_version(incremental=incremental, on_batch=self.stream_batch,
+                                                               background=background))
         else:
-            return len(self.query.sorted_score_results)
+            for index in indices:
+                logger.debug(f'Refreshing {self.catalog.search_paths[index].full_path} in the background')
+                self.version_built.emit(self.catalog.crawl_version(incremental=incremental, background=background,
+                                                                   indices=[index]))
+        self.build_letter_queries()
+
+    def build_letter_queries(self) -> None:
+        # Against the latest version, which is installed before they are (the signals are delivered in order)
+        version = self.catalog.latest_version
+        if version.items:
+            letter_queries = self.catalog.build_letter_queries(version)
+            if letter_queries.queries:
+                self.letter_queries_built.emit(letter_queries)
+
+    def stream_batch(self, found_paths: list[str]) -> None:
+        self.version_built.emit(self.catalog.build_streamed_version(found_paths))
+
+    @QtCore.Slot(object)
+    def install_version(self, version: CatalogVersion) -> None:
+        if self.catalog.install_version(version):
+            self.catalog_updated.emit()
+
+    @QtCore.Slot(object)
+    def install_letter_queries(self, letter_queries: LetterQueries) -> None:
+        added = self.catalog.install_letter_queries(letter_queries)
+        logger.debug(f'Installed {added} of {len(letter_queries.queries)} letter queries')
+
+
+class CatalogWatcher(QtCore.QObject):
+    """
+    Watches the directories visited by the catalog's last crawl (so each SearchPathEntry's search_depth is
+    respected) and applies additions, removals and renames to the catalog as they happen. Changed directories are
+    rescanned, and a catalog version with the resulting changes built, on the watcher's thread; the version is
+    installed on the GUI thread.
+
+    Emits fallback_needed if watching stops working (watch limit exhausted), in which case the caller should go back
+    to periodic refreshes, and rescan_needed if events were lost and a full incremental refresh is required. Search
+    paths whose crawl timed out aren't fully watched, so the caller should keep refreshing those periodically.
+    """
+    catalog: Catalog
+    changes_found = QtCore.Signal(object)
+    catalog_updated = QtCore.Signal()
+    fallback_needed = QtCore.Signal()
+    rescan_needed = QtCore.Signal()
+
+    # Changes tend to arrive in bursts (e.g. unzipping an archive), so wait for things to settle before rescanning
+    settle_time = 0.5
+
+    def __init__(self, *args, catalog: Catalog, **kwargs):
+        super(CatalogWatcher, self).__init__(*args, **kwargs)
+        self.catalog = catalog
+        self.watcher = None
+        self._worker = None
+        self.changes_found.connect(self.apply_changes)
+
+    @property
+    def watching(self) -> bool:
+        return self.watcher is not None
+
+    @property
+    def watch_count(self) -> int:
+        return 0 if self.watcher is None else self.watcher.watch_count
+
+    def start(self) -> bool:
+        """Starts watching, returning False if watching isn't available (in which case nothing changes)"""
+        if not InotifyWatcher.is_supported():
+            logger.info('Filesystem watching not supported on this platform')
+            return False
+
+        self.watcher = InotifyWatcher()
+        if not self.sync():
+            return False
+        self._worker = threading.Thread(target=self.run, name='canaveral-watch', daemon=True)
+        self._worker.start()
+        return True
+
+    def stop(self) -> None:
+        if self.watcher is not None:
+            watcher, self.watcher = self.watcher, None
+            watcher.close()
+
+    @QtCore.Slot()
+    def sync(self) -> bool:
+        """Updates the watched directories to match the crawler's snapshots, e.g. after a refresh"""
+        if self.watcher is None:
+            return False
+
+        directories = {path for dir_snapshots in self.catalog.crawler.snapshots.values() for path in dir_snapshots}
+        try:
+            self.watcher.watch(directories)
+        except WatchLimitReached as e:
+            logger.warning(f'{e}; falling back to periodic refreshes')
+            self.stop()
+            self.fallback_needed.emit()
+            return False
+
+        logger.debug(f'Watching {self.watch_count} directories')
+        return True
+
+    def run(self) -> None:
+        while (watcher := self.watcher) is not None:
+            try:
+                changed = watcher.read_changed_directories(timeout=1.0)
+                if changed:
+                    while more := watcher.read_changed_directories(timeout=self.settle_time):
+                        changed |= more
+            except EventsLost as e:
+                logger.warning(f'{e}; rescanning')
+                self.rescan_needed.emit()
+                continue
+            except (OSError, ValueError):  # closed by stop()
+                break
+
+            if changed:
+                version = self.catalog.rescan_version(changed)
+                if version is not None:
+                    self.changes_found.emit(version)
+                self.sync()
+
+    @QtCore.Slot(object)
+    def apply_changes(self, version: CatalogVersion) -> None:
+        if self.catalog.install_version(version):
+            self.catalog_updated.emit()
@@ -0,0 +1,47 @@
+"""
+Search keys: the form of an item's name that queries are matched against. A key is casefolded, NFKD-normalized and
+stripped of combining marks (accents), so 'Café', 'CAFÉ' and 'cafe' all have the key 'cafe', and compatibility
+characters are spelled out, e.g. 'ﬁ' -> 'fi' and 'Straße' -> 'strasse'. Keys are computed once, when an item is added
+to the store, and query text is folded the same way when a query is made.
+
+Folding can change the length of a name, so each key can come with offsets: the position in the name of the character
+that each key character came from. Most names fold one character to one character (all ASCII names do), and those
+need no offsets.
+"""
+from __future__ import annotations
+
+import unicodedata
+from array import array
+
+
+def _fold_char(char: str) -> str:
+    # Casefolding can produce characters that decompose further (and vice versa), hence NFKD on both sides
+    decomposed = unicodedata.normalize('NFKD', unicodedata.normalize('NFKD', char).casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def search_key(text: str) -> str:
+    """The search key for text, e.g. query text"""
+    if text.isascii():
+        return text.lower()
+    return ''.join(_fold_char(char) for char in text)
+
+
+def search_key_with_offsets(name: str) -> tuple[str, array | None]:
+    """
+    The search key for name, along with the position in name of each key character, or None if the key is the same
+    length as the name and each key character came from the name character at the same position
+    """
+    if name.isascii():
+        return name.lower(), None
+
+    parts = []
+    offsets = array('I')
+    for position, char in enumerate(name):
+        folded = _fold_char(char)
+        parts.append(folded)
+        offsets.extend([position] * len(folded))
+    key = ''.join(parts)
+    if len(key) == len(name) and all(offset == position for position, offset in enumerate(offsets)):
+        return key, None
+    return key, offsets
@@ -0,0 +1,264 @@
+"""
+Compact on-disk snapshot of the crawler's directory snapshots and the catalog's items, from which the catalog can be
+rebuilt at startup without touching the filesystem.
+
+Layout (little-endian):
+    header:  magic (4 bytes), format version (uint32), record count (uint64), stat count (uint64),
+             string count (uint64), suffix blob length (uint64), items length (uint64)
+    records: uint32 array
+    stats:   int64 array
+    prefix lengths: uint8 array, one per string
+    suffixes: NUL-separated UTF-8 blob
+    items:   the catalog's items, as the columns of an ItemStore (see below), or nothing
+
+The strings are referenced from the records by index, and are stored sorted & front-coded: each string is the first
+prefix length characters of the one before it, followed by its suffix. Since directory paths share long prefixes
+with their neighbours in sorted order, as do names like 'Report 2019.docx' & 'Report 2020.docx', this stores little
+more than the part of each string that differs.
+
+The records hold, for each search path: [key string, directory count], followed for each directory by
+[path string, descended, match count, subdir count, symlinked subdir count, *match names, *subdir names,
+*symlinked subdir names]. The values that need 64 bits are kept apart in the stats array, in the same order, so the
+records only need 32 bits per value: for each directory, [mtime_ns (-1 if untrusted), .gitignore mtime_ns (-1 if
+none), *match (mtime, size) pairs].
+Names are interned, so a name that occurs in many directories (e.g. desktop.ini) is stored once.
+
+The items section holds the fields of a StoreColumns in order, each as a typecode (1 byte) & a byte length (uint64)
+followed by the data: an array's items for an array typecode, UTF-8 for a string ('u'), or the string count (uint64)
+and NUL-separated UTF-8 for a list of strings ('s'). Loading them is little more than copying the bytes, where
+rebuilding the items from their paths would mean working out every search key, character index & posting list again.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from dataclasses import fields
+from pathlib import Path
+
+from canaveral.crawler import DirSnapshot
+from canaveral.itemstore import StoreColumns
+
+MAGIC = b'CNVS'
+FORMAT_VERSION = 6
+HEADER = struct.Struct('<4sIQQQQQ')
+COLUMN_HEADER = struct.Struct('<cQ')
+STRING_COUNT = struct.Struct('<Q')
+MIN_PREFIX_LENGTH = 4
+MAX_PREFIX_LENGTH = 255
+ENCODING_ERRORS = 'surrogatepass'  # round-trips any filename Python can represent
+
+
+class SnapshotFormatError(Exception):
+    """Raised when a snapshot file was written with a different format version, or is damaged"""
+
+
+def _encode_key(key: tuple) -> str:
+    return json.dumps(key)
+
+
+def _decode_key(value):
+    if isinstance(value, list):
+        return tuple(_decode_key(v) for v in value)
+    return value
+
+
+def _front_code(strings: list[str]) -> tuple[array, str]:
+    prefix_lengths = array('B')
+    suffixes = []
+    previous = ''
+    for s in strings:
+        prefix_length = min(len(os.path.commonprefix((previous, s))), MAX_PREFIX_LENGTH)
+        if prefix_length < MIN_PREFIX_LENGTH:  # not worth the time to put back together when loading
+            prefix_length = 0
+        prefix_lengths.append(prefix_length)
+        suffixes.append(s[prefix_length:])
+        previous = s
+    return prefix_lengths, '\0'.join(suffixes)
+
+
+def _front_decode(prefix_lengths: array, suffixes: list[str]) -> list[str]:
+    strings = []
+    previous = ''
+    for prefix_length, suffix in zip(prefix_lengths, suffixes):
+        previous = previous[:prefix_length] + suffix if prefix_length else suffix
+        strings.append(previous)
+    return strings
+
+
+def _encode_columns(columns: StoreColumns) -> bytes:
+    parts = []
+    for value in (getattr(columns, field.name) for field in fields(columns)):
+        if isinstance(value, array):
+            typecode = value.typecode
+            if sys.byteorder == 'big':
+                value = array(typecode, value)
+                value.byteswap()
+            data = value.tobytes()
+        elif isinstance(value, str):
+            typecode, data = 'u', value.encode('utf-8', ENCODING_ERRORS)
+        else:
+            typecode, data = 's', STRING_COUNT.pack(len(value)) + '\0'.join(value).encode('utf-8', ENCODING_ERRORS)
+        parts += [COLUMN_HEADER.pack(typecode.encode(), len(data)), data]
+    return b''.join(parts)
+
+
+def _decode_columns(view: memoryview) -> StoreColumns:
+    values = []
+    position = 0
+    for _ in fields(StoreColumns):
+        typecode, length = COLUMN_HEADER.unpack_from(view, position)
+        typecode = typecode.decode()
+        position += COLUMN_HEADER.size
+        with view[position:position + length] as data:
+            if len(data) != length:
+                raise SnapshotFormatError('catalog items are truncated')
+            if typecode == 'u':
+                values.append(str(data, 'utf-8', ENCODING_ERRORS))
+            elif typecode == 's':
+                count, = STRING_COUNT.unpack_from(data)
+                with data[STRING_COUNT.size:] as blob:
+                    strings = str(blob, 'utf-8', ENCODING_ERRORS).split('\0') if count else []
+                if len(strings) != count:
+                    raise SnapshotFormatError('catalog items are damaged')
+                values.append(strings)
+            else:
+                value = array(typecode)
+                value.frombytes(data)
+                if sys.byteorder == 'big':
+                    value.byteswap()
+                values.append(value)
+        position += length
+    if position != len(view):
+        raise SnapshotFormatError('catalog items are damaged')
+    return StoreColumns(*values)
+
+
+def save_catalog_snapshot(file: Path, snapshots: dict[tuple, dict[str, DirSnapshot]],
+                          items: StoreColumns | None = None) -> None:
+    unique_strings = set()
+    for key, dir_snapshots in snapshots.items():
+        unique_strings.add(_encode_key(key))
+        for path, snapshot in dir_snapshots.items():
+            unique_strings.add(path)
+            unique_strings.update(snapshot.match_names, snapshot.subdir_names, snapshot.link_names)
+    strings = sorted(unique_strings)
+    intern = {s: index for index, s in enumerate(strings)}.__getitem__
+    records = array('I')
+    stats = array('q')
+
+    for key, dir_snapshots in snapshots.items():
+        records.extend((intern(_encode_key(key)), len(dir_snapshots)))
+        for path, snapshot in dir_snapshots.items():
+            records.extend((intern(path),
+                            snapshot.descended,
+                            len(snapshot.match_names),
+                            len(snapshot.subdir_names),
+                            len(snapshot.link_names)))
+            records.extend(intern(name) for name in snapshot.match_names)
+            records.extend(intern(name) for name in snapshot.subdir_names)
+            records.extend(intern(name) for name in snapshot.link_names)
+            stats.extend((-1 if snapshot.mtime_ns is None else snapshot.mtime_ns,
+                          -1 if snapshot.gitignore_mtime_ns is None else snapshot.gitignore_mtime_ns))
+            if len(snapshot.match_stats) == 2 * len(snapshot.match_names):
+                stats.extend(snapshot.match_stats)
+            else:  # no stats were captured
+                stats.extend(array('q', [0, 0]) * len(snapshot.match_names))
+
+    if sys.byteorder == 'big':
+        records.byteswap()
+        stats.byteswap()
+    prefix_lengths, suffixes = _front_code(strings)
+    blob = suffixes.encode('utf-8', ENCODING_ERRORS)
+    items_data = b'' if items is None else _encode_columns(items)
+
+    # Write to a temporary file and swap it in, so a crash mid-write never leaves a truncated snapshot behind
+    temp_file = file.with_name(file.name + '.tmp')
+    with open(temp_file, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(records), len(stats), len(strings), len(blob),
+                            len(items_data)))
+        f.write(records.tobytes())
+        f.write(stats.tobytes())
+        f.write(prefix_lengths.tobytes())
+        f.write(blob)
+        f.write(items_data)
+    os.replace(temp_file, file)
+
+
+def load_catalog_snapshot(file: Path) -> tuple[dict[tuple, dict[str, DirSnapshot]], StoreColumns | None]:
+    """The crawler's directory snapshots, and the catalog's items if they were saved along with them"""
+    if file.stat().st_size < HEADER.size:
+        raise SnapshotFormatError(f'{file} is too short to be a catalog snapshot')
+
+    try:
+        with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, version = struct.unpack_from('<4sI', mm, 0)
+            if magic != MAGIC:
+                raise SnapshotFormatError(f'{file} is not a catalog snapshot')
+            if version != FORMAT_VERSION:
+                raise SnapshotFormatError(f'{file} has format version {version}, expected {FORMAT_VERSION}')
+            _, _, record_count, stat_count, string_count, blob_length, items_length = HEADER.unpack_from(mm, 0)
+
+            records_end = HEADER.size + 4 * record_count
+            stats_end = records_end + 8 * stat_count
+            prefixes_end = stats_end + string_count
+            blob_end = prefixes_end + blob_length
+            if len(mm) != blob_end + items_length:
+                raise SnapshotFormatError(f'{file} is truncated')
+
+            records = array('I')
+            stats = array('q')
+            prefix_lengths = array('B')
+            with memoryview(mm) as view:
+                with view[HEADER.size:records_end] as record_bytes:
+                    records.frombytes(record_bytes)
+                with view[records_end:stats_end] as stat_bytes:
+                    stats.frombytes(stat_bytes)
+                with view[stats_end:prefixes_end] as prefix_bytes:
+                    prefix_lengths.frombytes(prefix_bytes)
+                with view[prefixes_end:blob_end] as blob:
+                    suffixes = str(blob, 'utf-8', ENCODING_ERRORS).split('\0') if string_count else []
+                if items_length:
+                    with view[blob_end:] as items_view:
+                        items = _decode_columns(items_view)
+                else:
+                    items = None
+            if len(suffixes) != string_count:
+                raise SnapshotFormatError(f'{file} is damaged')
+            strings = _front_decode(prefix_lengths, suffixes)
+
+        if sys.byteorder == 'big':
+            records.byteswap()
+            stats.byteswap()
+
+        snapshots = {}
+        position = 0
+        stats_position = 0
+        while position < len(records):
+            key_index, search_path_dir_count = records[position:position + 2]
+            position += 2
+            dir_snapshots = snapshots[_decode_key(json.loads(strings[key_index]))] = {}
+            for _ in range(search_path_dir_count):
+                path_index, descended, match_count, subdir_count, link_count = records[position:position + 5]
+                position += 5
+                match_names = [strings[i] for i in records[position:position + match_count]]
+                position += match_count
+                subdir_names = [strings[i] for i in records[position:position + subdir_count]]
+                position += subdir_count
+                link_names = [strings[i] for i in records[position:position + link_count]]
+                position += link_count
+                mtime_ns, gitignore_mtime_ns = stats[stats_position:stats_position + 2]
+                match_stats = stats[stats_position + 2:stats_position + 2 + 2 * match_count]
+                stats_position += 2 + 2 * match_count
+                if len(match_stats) != 2 * match_count:
+                    raise SnapshotFormatError(f'{file} is damaged')
+                dir_snapshots[strings[path_index]] = DirSnapshot(
+                    None if mtime_ns == -1 else mtime_ns, bool(descended), match_names, subdir_names,
+                    None if gitignore_mtime_ns == -1 else gitignore_mtime_ns, link_names, match_stats)
+    except (ValueError, IndexError, TypeError, struct.error) as e:
+        raise SnapshotFormatError(f'{file} is damaged') from e
+
+    return snapshots, items
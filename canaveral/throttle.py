@@ -0,0 +1,106 @@
+"""
+Keeping background crawls out of the way of other applications: a rate limit on directory visits, and lowered I/O
+priority for the threads doing the crawling.
+
+I/O priority is supported on Linux (the idle I/O scheduling class, honoured by the BFQ and CFQ schedulers) and on
+Windows (background processing mode). Elsewhere only the rate limit applies.
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import platform
+import sys
+import threading
+import time
+
+from loguru import logger
+
+DEFAULT_BACKGROUND_CRAWL_RATE = 1000  # directories per second
+
+# From <linux/ioprio.h>
+IOPRIO_WHO_PROCESS = 1  # with an id of 0, the calling thread
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_CLASS_IDLE = 3
+SYS_IOPRIO_SET = {'x86_64': 251, 'aarch64': 30, 'i386': 289, 'i686': 289, 'armv7l': 314}
+
+# From <winbase.h>
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+THREAD_MODE_BACKGROUND_END = 0x00020000
+
+
+class Throttle:
+    """
+    Limits the rate at which directories are visited, shared between all the threads of a crawl. Up to
+    burst_time seconds of unused budget can be caught up on, so coarse sleep timers (~15 ms on Windows) don't eat into
+    the rate. held_time is how long the crawl has been held back (time during which at least one thread was made to
+    wait), so it can be left out of crawl deadlines.
+    """
+    rate: float  # directories per second
+    burst_time: float
+
+    def __init__(self, rate: float, burst_time: float = 0.1):
+        self.rate = rate
+        self.burst_time = burst_time
+        self._interval = 1 / rate
+        self._next_time = time.monotonic()
+        self._held_until = self._next_time
+        self._held_time = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'Throttle(rate={self.rate})'
+
+    @property
+    def held_time(self) -> float:
+        """Seconds the crawl has been held back so far, including any wait that is still going on"""
+        with self._lock:
+            return self._held_time - max(0.0, self._held_until - time.monotonic())
+
+    def wait(self) -> None:
+        """Blocks until the calling thread may visit another directory"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_time, now - self.burst_time)
+            self._next_time = slot + self._interval
+            if slot > self._held_until:  # waits overlap between threads, so only the time not yet counted is added
+                self._held_time += slot - max(now, self._held_until)
+                self._held_until = slot
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _set_linux_io_priority(background: bool) -> bool:
+    number = SYS_IOPRIO_SET.get(platform.machine())
+    if number is None:
+        return False
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    # Priority 0 with no class restores the default, which follows the thread's CPU nice level
+    priority = IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT if background else 0
+    return libc.syscall(number, IOPRIO_WHO_PROCESS, 0, priority) == 0
+
+
+def _set_windows_io_priority(background: bool) -> bool:
+    kernel32 = ctypes.windll.kernel32
+    mode = THREAD_MODE_BACKGROUND_BEGIN if background else THREAD_MODE_BACKGROUND_END
+    return bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(), mode))
+
+
+def set_background_io_priority(background: bool = True) -> bool:
+    """
+    Lowers the calling thread's I/O priority so its disk access yields to other applications, or restores it with
+    background=False. Returns False if that isn't supported here.
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            supported = _set_linux_io_priority(background)
+        elif sys.platform == 'win32':
+            supported = _set_windows_io_priority(background)
+        else:
+            supported = False
+    except (OSError, AttributeError):
+        supported = False
+
+    if not supported and background:
+        logger.debug('Lowering I/O priority is not supported here, background crawls are only rate limited')
+    return supported
@@ -0,0 +1,165 @@
+"""
+A vectorized alternative to the Query engine, for ranking a whole catalog at once. Query works out the best alignment
+of the query's letters in each item's search key one item at a time, building a Match for each. This engine gets the
+same best scores with NumPy array operations over all the items, and only builds Match objects for the top k.
+
+The search keys are packed into padded code-point matrices (one per bucket of similar lengths, to limit the padding),
+along with a matrix marking the key positions that start a word. For each letter of the query, a dynamic program
+finds the best partial score of any match ending at each key position:
+
+    best[j] = word_start[j] * INITIAL_LETTERS_NAME_WEIGHT + max(max(best'[:j-1]), best'[j-1] + CONSEC_NAME_WEIGHT)
+
+where best' is the previous letter's row, and positions that don't hold the letter are -inf. An item's best score is
+the maximum of its last row, plus the non-consecutive, launch & recently modified components, which are the same for
+every match of an item. Items that no longer have any finite position are dropped after each letter.
+
+The weights are multiples of 1/4 and the counts are small, so the partial sums are exact and the totals are identical
+to the ones Score.update_total computes. Ties are ranked by item id, as Query's are (bar items added to a query
+after it was made, which go last).
+
+NumPy is optional; without it, VectorizedEngine raises ImportError.
+"""
+from __future__ import annotations
+
+from time import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from canaveral.basemodels import (Catalog, CatalogVersion, Query, ScoreResult, starts_word, WORD_SEPARATORS,
+                                  CONSEC_NAME_WEIGHT, INITIAL_LETTERS_NAME_WEIGHT, NONCONSEC_NAME_WEIGHT,
+                                  LATEST_MATCH_WEIGHT, PREVIOUSLY_LAUNCHED_WEIGHT, RECENTLY_MODIFIED_WEIGHT,
+                                  RECENTLY_MODIFIED_DAYS, SECONDS_PER_DAY)
+from canaveral.searchkey import search_key
+
+MIN_BUCKET_WIDTH = 16  # bucket widths are powers of two from here
+
+
+class _Bucket:
+    """Items whose search keys fit in width characters, as padded matrices"""
+
+    def __init__(self, width: int, item_ids: list[int], keys: list[str], word_starts: dict[int, list[bool]],
+                 mtimes: list[int]):
+        self.item_ids = np.array(item_ids, dtype=np.int64)
+        codes = np.frombuffer(''.join(key.ljust(width, '\0') for key in keys).encode('utf-32-le'), dtype=np.uint32)
+        codes = codes.reshape(len(keys), width)
+        self.codes = codes.astype(np.uint16) if codes.max(initial=0) < 0x10000 else codes
+
+        # A position starts a word if it's the first, or follows a separator. Names with characters outside ASCII
+        # are worked out from the name itself (see Match), as their key positions needn't line up with the name's.
+        separators = np.array([ord(c) for c in WORD_SEPARATORS], dtype=self.codes.dtype)
+        starts = np.zeros(self.codes.shape, dtype=bool)
+        starts[:, 0] = True
+        starts[:, 1:] = np.isin(self.codes[:, :-1], separators)
+        for row, row_starts in word_starts.items():
+            starts[row, :] = False
+            starts[row, :len(row_starts)] = row_starts
+        # float32 is plenty: the partial scores are small multiples of 1/4, so they stay exact
+        self.start_bonus = np.where(starts, INITIAL_LETTERS_NAME_WEIGHT, 0.0).astype(np.float32)
+        self.mtimes = np.array(mtimes, dtype=np.float64)
+
+    def best_scores(self, query_text: str) -> tuple[np.ndarray, np.ndarray]:
+        """Rows of the items that match query_text, and the best consecutive + initial letter score of each"""
+        rows = np.arange(len(self.item_ids))
+        best = None
+        for position, char in enumerate(query_text):
+            code = ord(char)
+            if code > np.iinfo(self.codes.dtype).max:
+                return rows[:0], np.empty(0)
+            codes = self.codes[rows]
+            bonus = self.start_bonus[rows]
+            if best is None:
+                best = np.where(codes == code, bonus, -np.inf)
+            else:
+                previous = np.full_like(best, -np.inf)  # best over all earlier positions, consecutive or not
+                previous[:, 1:] = np.maximum.accumulate(best, axis=1)[:, :-1]
+                consecutive = np.full_like(best, -np.inf)
+                consecutive[:, 1:] = best[:, :-1] + CONSEC_NAME_WEIGHT
+                best = np.where(codes == code, bonus + np.maximum(previous, consecutive), -np.inf)
+            alive = np.isfinite(best).any(axis=1)
+            if not alive.all():
+                rows, best = rows[alive], best[alive]
+            if not len(rows):
+                break
+        return rows, best.max(axis=1).astype(np.float64) if len(rows) else np.empty(0)
+
+
+class VectorizedEngine:
+    """Ranks the items of one catalog version against a query using NumPy. See the module docstring."""
+
+    def __init__(self, catalog: Catalog, version: CatalogVersion):
+        if np is None:
+            raise ImportError('The vectorized engine needs NumPy, which is not installed')
+        self.catalog = catalog
+        self.generation = version.generation
+        store = catalog.store
+
+        grouped: dict[int, tuple[list, list, dict, list]] = {}
+        for item_id in version.items:
+            key = store.search_key(item_id)
+            width = MIN_BUCKET_WIDTH
+            while width < len(key):
+                width *= 2
+            item_ids, keys, word_starts, mtimes = grouped.setdefault(width, ([], [], {}, []))
+            name = store.name(item_id)
+            if not name.isascii():
+                offsets = store.key_offsets(item_id)
+                word_starts[len(keys)] = [starts_word(name, offsets, j) for j in range(len(key))]
+            item_ids.append(item_id)
+            keys.append(key)
+            mtimes.append(store.mtime(item_id))
+        self.buckets = [_Bucket(width, *columns) for width, columns in sorted(grouped.items())]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(bucket.item_ids.nbytes + bucket.codes.nbytes + bucket.start_bonus.nbytes +
+                   bucket.mtimes.nbytes for bucket in self.buckets)
+
+    def scores(self, query_text: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The ids of the items that match query_text and their total scores, ordered best first (ties by item id)
+        """
+        query_text = search_key(query_text)
+        if not query_text:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        catalog = self.catalog
+        latest_id = catalog.launch_choice_ids.get(query_text, -1)
+        recent_ids = np.fromiter(catalog.recent_launch_ids, dtype=np.int64)
+        now = time()
+
+        all_ids, all_scores = [], []
+        for bucket in self.buckets:
+            rows, best = bucket.best_scores(query_text)
+            if not len(rows):
+                continue
+            item_ids = bucket.item_ids[rows]
+            # Summed in the same order as Score.update_total, so the totals come out identical
+            total = best + len(query_text) * NONCONSEC_NAME_WEIGHT
+            total = total + (item_ids == latest_id) * LATEST_MATCH_WEIGHT
+            total = total + np.isin(item_ids, recent_ids) * PREVIOUSLY_LAUNCHED_WEIGHT
+            mtimes = bucket.mtimes[rows]
+            age = (now - mtimes) // SECONDS_PER_DAY
+            recently_modified = np.where(mtimes != 0, np.maximum(0.0, 1 - age / RECENTLY_MODIFIED_DAYS), 0)
+            total = total + recently_modified * RECENTLY_MODIFIED_WEIGHT
+            all_ids.append(item_ids)
+            all_scores.append(total)
+
+        if not all_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        item_ids, scores = np.concatenate(all_ids), np.concatenate(all_scores)
+        ranking = np.lexsort((item_ids, -scores))
+        return item_ids[ranking], scores[ranking]
+
+    def top_k(self, query_text: str, k: int = 10) -> list[ScoreResult]:
+        """The k best results for query_text, each with its Match (from Query.match_item)"""
+        item_ids, scores = self.scores(query_text)
+        query_text = search_key(query_text)
+        results = []
+        for item_id, score in zip(item_ids[:k].tolist(), scores[:k].tolist()):
+            match = Query.match_item(self.catalog, item_id, query_text)
+            results.append(ScoreResult(item=match.catalog_item, match=match, total_score=score))
+        return results
+
@@ -0,0 +1,152 @@
+"""
+Filesystem watching, so that changes to the indexed directories reach the catalog as they happen instead of on the
+next periodic refresh. The watcher only reports which directories changed; the crawler then rescans just those.
+
+Currently only Linux (inotify, via ctypes) is supported. Elsewhere, or once the kernel's watch limit
+(fs.inotify.max_user_watches) is exhausted, callers fall back to periodic refreshes.
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+from typing import Iterable
+
+from loguru import logger
+
+# Event flags, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_CLOSE_WRITE |
+              IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len (followed by len bytes of NUL-padded name)
+
+
+class WatchLimitReached(Exception):
+    """Raised when the kernel refuses to add any more watches"""
+
+
+class EventsLost(Exception):
+    """Raised when the kernel's event queue overflowed, so some changes weren't reported"""
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    return libc if hasattr(libc, 'inotify_init1') else None
+
+
+class InotifyWatcher:
+    """
+    Watches a set of directories with inotify and reports the ones whose entries were created, deleted or renamed,
+    or whose .gitignore was modified.
+    Thread-safe: the set of watched directories can be updated from one thread while another waits for changes.
+    """
+    _libc = None
+
+    def __init__(self):
+        if InotifyWatcher._libc is None:
+            InotifyWatcher._libc = _load_libc()
+        if InotifyWatcher._libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available on this platform')
+
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self._lock = threading.Lock()
+        self._paths_by_wd = {}
+        self._wds_by_path = {}
+
+    def __repr__(self):
+        return f'InotifyWatcher: {self.watch_count} directories watched'
+
+    @staticmethod
+    def is_supported() -> bool:
+        if InotifyWatcher._libc is None:
+            InotifyWatcher._libc = _load_libc()
+        return InotifyWatcher._libc is not None
+
+    @property
+    def watch_count(self) -> int:
+        return len(self._wds_by_path)
+
+    def watch(self, directories: Iterable[str]) -> None:
+        """Makes the watched set equal to directories, adding and removing watches as needed"""
+        directories = set(directories)
+        with self._lock:
+            for path in set(self._wds_by_path) - directories:
+                self._libc.inotify_rm_watch(self._fd, self._wds_by_path.pop(path))
+
+            for path in directories - set(self._wds_by_path):
+                wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+                if wd < 0:
+                    error = ctypes.get_errno()
+                    if error == errno.ENOSPC:
+                        raise WatchLimitReached(f'inotify watch limit reached after {self.watch_count} directories '
+                                                f'(see fs.inotify.max_user_watches)')
+                    # Vanished or unreadable since it was crawled; the next rescan of its parent will catch up
+                    continue
+                self._wds_by_path[path] = wd
+                self._paths_by_wd[wd] = path
+
+    def read_changed_directories(self, timeout: float | None = None) -> set[str]:
+        """
+        Waits up to timeout seconds for events, returning the directories that changed (empty if none did). Raises
+        EventsLost if the kernel dropped events, in which case the caller should fall back to a full refresh.
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        position = 0
+        with self._lock:
+            while position < len(buffer):
+                wd, mask, _, name_length = EVENT_HEADER.unpack_from(buffer, position)
+                name = buffer[position + EVENT_HEADER.size:position + EVENT_HEADER.size + name_length].rstrip(b'\0')
+                position += EVENT_HEADER.size + name_length
+
+                if mask & IN_Q_OVERFLOW:
+                    raise EventsLost('inotify event queue overflowed')
+                path = self._paths_by_wd.get(wd)
+                if path is None:
+                    continue
+                if mask & IN_IGNORED:  # watch removed, either by us or because the directory is gone
+                    del self._paths_by_wd[wd]
+                    if self._wds_by_path.get(path) == wd:
+                        del self._wds_by_path[path]
+                    continue
+                if mask & IN_CLOSE_WRITE and name != b'.gitignore':  # other files' contents don't matter
+                    continue
+                changed.add(path)
+
+        return changed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd >= 0:
+                os.close(self._fd)
+                self._fd = -1
+            self._paths_by_wd.clear()
+            self._wds_by_path.clear()
+        logger.debug('Filesystem watcher closed')
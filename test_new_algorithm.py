@@ -153,3 +153,256 @@ q = queries[-2]
 q.print_detailed_scores()
 
 q.matches[0]
+
+#%% Incremental refresh should give the same items as a full rescan, after files & directories are changed, added
+# and deleted
+import os
+import shutil
+import tempfile
+
+refresh_tree = Path(tempfile.mkdtemp())
+for i in range(20):
+    for j in range(5):
+        (refresh_tree / f'dir{i}' / f'sub{j}').mkdir(parents=True)
+        (refresh_tree / f'dir{i}' / f'sub{j}' / f'file{j}.txt').write_text('')
+        (refresh_tree / f'dir{i}' / f'sub{j}' / f'other{j}.log').write_text('')
+c = Catalog([SearchPathEntry(path=str(refresh_tree), search_depth=-1, patterns=['*.txt'], include_dirs=True),
+             SearchPathEntry(path=str(refresh_tree / 'dir3'), search_depth=1, patterns=['*.log'])])
+
+(refresh_tree / 'dir0' / 'sub0' / 'file0.txt').write_text('changed')
+(refresh_tree / 'dir1' / 'sub1' / 'added.txt').write_text('')
+(refresh_tree / 'dir2' / 'new' / 'deeper').mkdir(parents=True)
+(refresh_tree / 'dir2' / 'new' / 'deeper' / 'added.txt').write_text('')
+(refresh_tree / 'dir3' / 'sub2' / 'file2.txt').unlink()
+(refresh_tree / 'dir3' / 'sub3' / 'other3.log').unlink()
+shutil.rmtree(refresh_tree / 'dir4')
+os.rename(refresh_tree / 'dir5', refresh_tree / 'renamed')
+
+times = [perf_counter()]
+c.refresh_items_list()
+times.append(perf_counter())
+incremental_items = {item.path for item in c.items}
+
+c.refresh_items_list(incremental=False)
+times.append(perf_counter())
+full_items = {item.path for item in c.items}
+
+assert incremental_items == full_items
+assert str(refresh_tree / 'dir2' / 'new' / 'deeper' / 'added.txt') in full_items
+assert not any(path.startswith(str(refresh_tree / 'dir4')) for path in full_items)
+print(f'Incremental refresh: {(times[1]-times[0])*1000:0.2f} ms, full rescan: {(times[2]-times[1])*1000:0.2f} ms')
+
+#%% Crawl throughput (files per second) with the compiled pattern matcher
+docs_entry = search_path_entries[0]
+file_count = sum(len(files) for _, _, files in os.walk(docs_entry.full_path))
+
+t = perf_counter()
+globs = list(deep_glob(docs_entry.full_path, depth=docs_entry.search_depth, patterns=docs_entry.patterns))
+elapsed = perf_counter() - t
+
+print(f'{len(globs)} matches from {file_count} files: {file_count/elapsed:,.0f} files/s')
+
+#%% A refresh that finds no changes should keep the cached queries as they are
+cached_queries = dict(c.queries)
+c.refresh_items_list()
+assert all(c.queries[query_text] is query for query_text, query in cached_queries.items())
+
+#%% Memory used per item: one object per item (a Path plus name & lower-case name strings) vs. the ItemStore
+import tracemalloc
+from dataclasses import dataclass, field
+from canaveral.itemstore import ItemStore
+
+
+@dataclass(frozen=True)
+class PathItem:  # how CatalogItem used to be stored
+    full_path: Path
+    name: str = field(init=False)
+    lower_name: str = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'name', self.full_path.name)
+        object.__setattr__(self, 'lower_name', self.full_path.name.lower())
+
+
+item_paths = [item.path for item in c.items]
+
+tracemalloc.start()
+path_items = {PathItem(Path(item_path)) for item_path in item_paths}
+path_item_bytes = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+del path_items
+
+tracemalloc.start()
+store = ItemStore()
+item_ids = frozenset(store.add(item_path) for item_path in item_paths)
+store_bytes = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+
+print(f'{len(item_paths)} items: {path_item_bytes/len(item_paths):0.0f} bytes/item as objects, '
+      f'{store_bytes/len(item_paths):0.0f} bytes/item in an ItemStore (including the set of ids)')
+
+#%% A warm start from the snapshot loads the items with their search keys & indexes instead of working them out again,
+# so it should take a fraction of the time of a cold start, and give the same items & results
+snapshot_file = refresh_tree / 'catalog.snapshot'
+snapshot_entries = [SearchPathEntry(path=str(refresh_tree), search_depth=-1, include_dirs=True)]
+
+t = perf_counter()
+cold = Catalog(snapshot_entries, snapshot_file=snapshot_file)
+cold_time = perf_counter() - t
+t = perf_counter()
+warm = Catalog(snapshot_entries, snapshot_file=snapshot_file, refresh=False)
+warm_time = perf_counter() - t
+
+
+def scored_paths(query):
+    # Ties are ranked by item id, which depends on the order a crawl happens to find the items in
+    return sorted((result.item.path, result.total_score) for result in query.score_results.values())
+
+
+assert warm.snapshot_loaded and not warm.queries
+assert {item.path for item in warm.items} == {item.path for item in cold.items}
+for query_text in ('f', 'sub', 'dir1'):
+    assert scored_paths(warm.query(query_text)) == scored_paths(cold.query(query_text))
+print(f'{len(warm.items)} items: cold start {cold_time*1000:0.1f} ms, warm start {warm_time*1000:0.1f} ms')
+
+#%% Vectorized engine vs. Query: time for each letter typed, and the top 10 should be the same
+times = [perf_counter()]
+engine = c.vectorized_engine
+times.append(perf_counter())
+print(f'Built vectorized engine in {(times[-1] - times[-2])*1000:0.1f} ms ({engine.nbytes/1e6:0.1f} MB)')
+
+c.queries.clear()
+q_text = 'python'
+for n in range(1, len(q_text) + 1):
+    t = perf_counter()
+    top = engine.top_k(q_text[:n], k=10)
+    vectorized_time = perf_counter() - t
+    t = perf_counter()
+    query = c.query(q_text[:n])
+    query_time = perf_counter() - t
+    same = [result.total_score for result in top] == \
+           [result.total_score for result in query.top(10)]
+    print(f'{q_text[:n]!r}: vectorized {vectorized_time*1000:0.1f} ms, query {query_time*1000:0.1f} ms, '
+          f'same top 10 scores: {same}')
+
+#%% Adversarial names: enumerating every alignment of 'eeee' in n e's would make comb(n, 4) matches, but the best
+# alignment per item costs time roughly linear in the name's length
+from math import comb
+from canaveral.basemodels import Query
+
+adversarial = Catalog([], refresh=False)
+for n in (8, 16, 32, 64, 128, 255):
+    for name in ('e' * n, 'e-' * (n // 2), 'Excel Reference Sheet ' * (n // 22 + 1)):
+        item_id = adversarial.store.add(str(Path('/adversarial') / name))
+        t = perf_counter()
+        match = Query.match_item(adversarial, item_id, 'eeee')
+        elapsed = perf_counter() - t
+        print(f'{len(name):4d} chars, {comb(name.count("e"), 4):>12,} alignments: {elapsed*1e6:8.1f} us, '
+              f'best {match.match_indices} (score {match.score.result})')
+
+#%% A throttled background crawl of a large tree should finish, however long the throttle makes it take: time held
+# back by the throttle doesn't count towards the crawl timeout
+import tempfile
+
+tree = Path(tempfile.mkdtemp())
+for i in range(300):
+    (tree / f'dir{i}').mkdir()
+throttled = Catalog([SearchPathEntry(path=str(tree), search_depth=-1, include_dirs=True)],
+                    background_crawl_rate=100, crawl_timeout=1.0)
+(tree / 'dir7' / 'new.txt').write_text('')
+throttled.set_items(throttled.crawl(background=True))
+assert not throttled.crawl_stats[0].timed_out and throttled.crawl_stats[0].directories_visited == 301
+assert throttled.store.lookup(str(tree / 'dir7' / 'new.txt')) in throttled.version.item_set
+
+#%% Items streamed from a crawl that then times out should be removed by a later full crawl once they're deleted
+streamed_tree = Path(tempfile.mkdtemp())
+(streamed_tree / 'old.txt').write_text('')
+streamed = Catalog([SearchPathEntry(path=str(streamed_tree), search_depth=-1)])
+(streamed_tree / 'streamed.txt').write_text('')
+streamed.install_version(streamed.build_streamed_version([str(streamed_tree / 'streamed.txt')]))
+streamed.set_items([None])  # the crawl timed out
+(streamed_tree / 'streamed.txt').unlink()
+streamed.refresh_items_list(incremental=False)
+assert streamed.store.lookup(str(streamed_tree / 'streamed.txt')) not in streamed.version.item_set
+
+#%% Query text that folds to an empty search key (a lone combining accent) has nothing to match, rather than failing
+assert c.query('\u0301') is None
+assert c.query('e\u0301') is c.query('\u00e9')
+
+#%% In exclude rules with a '/', '*' stops at a '/' (as in .gitignore files) while '**' matches across them
+from canaveral.crawler import ExcludeRules
+
+exclude = ExcludeRules(['projects/*/dist', 'other/**/dist'])
+assert exclude('dist', os.path.join('projects', 'a', 'dist'))
+assert not exclude('dist', os.path.join('projects', 'a', 'b', 'c', 'dist'))
+assert exclude('dist', os.path.join('other', 'a', 'b', 'c', 'dist'))
+
+#%% Search paths with the same root but different depths aren't merged as duplicates
+depth_tree = Path(tempfile.mkdtemp())
+(depth_tree / 'sub').mkdir()
+(depth_tree / 'top.txt').write_text('')
+(depth_tree / 'sub' / 'deep.txt').write_text('')
+depths = Catalog([SearchPathEntry(path=str(depth_tree), search_depth=0),
+                  SearchPathEntry(path=str(depth_tree), search_depth=-1)])
+assert [sorted(depths.store.name(item_id) for item_id in partition) for partition in depths.partitions] == \
+       [['top.txt'], ['deep.txt', 'top.txt']]
+
+#%% Letter queries can be built on another thread (as CatalogRefresher does) and installed with the same results
+import string
+import threading
+
+letters = Catalog([SearchPathEntry(path=str(refresh_tree), search_depth=-1, include_dirs=True)])
+unbuilt = Catalog([SearchPathEntry(path=str(refresh_tree), search_depth=-1, include_dirs=True)])
+built = []
+builder = threading.Thread(target=lambda: built.append(letters.build_letter_queries(letters.latest_version)))
+builder.start()
+builder.join()
+assert letters.install_letter_queries(built[0]) == len(string.ascii_lowercase)
+for letter in 'dfs':
+    assert scored_paths(letters.queries[letter]) == scored_paths(unbuilt.query(letter))
+
+#%% A rescan that comes in while a refresh is building its version isn't undone by the refresh's older results
+import time
+
+race_tree = Path(tempfile.mkdtemp())
+(race_tree / 'a.txt').write_text('')
+race = Catalog([SearchPathEntry(path=str(race_tree))])
+crawled = threading.Event()
+build_version = race.build_version
+
+
+def slow_build_version(*args, **kwargs):
+    crawled.set()
+    time.sleep(0.5)
+    return build_version(*args, **kwargs)
+
+
+race.build_version = slow_build_version
+versions = []
+refresher = threading.Thread(target=lambda: versions.append(race.crawl_version()))
+refresher.start()
+crawled.wait()
+(race_tree / 'x.txt').write_text('')
+watcher = threading.Thread(target=lambda: versions.append(race.rescan_version({str(race_tree)})))
+watcher.start()
+refresher.join()
+watcher.join()
+for version in versions:
+    race.install_version(version)
+assert race.store.lookup(str(race_tree / 'x.txt')) in race.version.item_set
+
+#%% A timeout of 0 or less means no limit, and search paths that timed out are still due for a retry while watching
+unlimited_tree = Path(tempfile.mkdtemp())
+for i in range(50):
+    (unlimited_tree / f'{i}.txt').write_text('')
+for timeout in (0, -1, None):
+    unlimited = Catalog([SearchPathEntry(path=str(unlimited_tree))], crawl_timeout=timeout)
+    assert len(unlimited.items) == 50 and not unlimited.crawl_stats[0].timed_out, timeout
+unlimited = Catalog([SearchPathEntry(path=str(unlimited_tree), crawl_timeout=0)], crawl_timeout=1e-9)
+assert len(unlimited.items) == 50
+
+timing_out = Catalog([SearchPathEntry(path=str(unlimited_tree), refresh_interval=1e-9),
+                      SearchPathEntry(path=str(race_tree), refresh_interval=1e-9, crawl_timeout=1e-9)])
+assert timing_out.crawl_stats[1].timed_out and not timing_out.crawl_stats[0].timed_out
+assert timing_out.due_search_paths() == [0, 1]
+assert timing_out.due_search_paths(timed_out_only=True) == [1]